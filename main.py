@@ -2,15 +2,14 @@ import wx
 import sys
 import os
 import random
-import json
-import codecs
 import time
 import threading
-import re
 from datetime import datetime
 
 from src import arabic
 from src import arabic_original
+from src import lattice_io
+from src import batch
 
 
 def resource_path(relative_path):
@@ -339,10 +338,9 @@ class Commands(object):
 
         lattice = None
         error = False
-        with open(input_file, mode="r", encoding="utf-8") as f:
-            json_data = json.load(f)
         try:
-            lattice, keywords = self.trans.tr_edit_lattice(json_data)
+            # best_pathのリンクだけを少しずつ読み込む
+            lattice, keywords = lattice_io.load_lattice(input_file)
         except Exception:
             dialog = wx.MessageDialog(parent=frame,
                                       message='jsonファイルが不正です',
@@ -353,9 +351,10 @@ class Commands(object):
             error = True
 
         if not error:
-            self.file_output(self.lattice2csv(lattice), path + ".csv")
+            # CSVの文字列全体は作らず、行ごとにファイルに書き込む
+            self.file_output(batch.csv_lines(lattice), path + ".csv")
             lattice = self.trans.execute(lattice)
-            self.file_output(self.lattice2csv(lattice), path + "(arabia).csv")
+            self.file_output(batch.csv_lines(lattice), path + "(arabia).csv")
 
             dialog = wx.MessageDialog(parent=frame,
                                       message="選択したjsonファイルと同じフォルダに\n ・" +
@@ -373,98 +372,22 @@ class Commands(object):
 
         output_folder = "output_" + datetime.now().strftime("%Y%m%d%H%M%S")
 
-        word = "一二三四五六七八九〇零十百千\d点、."
-        target_list = re.compile('[' + word + ']')
-
         folder = wx.DirDialog(
             parent=frame,
             message="jsonファイルがあるフォルダを選択",
             style=wx.DD_CHANGE_DIR,
             )
 
-        result = {}
-        input_files = []
-        lattice = None
         input_folder = ""
         if folder.ShowModal() == wx.ID_OK:
             input_folder = folder.GetPath()
-            input_files = os.listdir(input_folder)
         folder.Destroy()
 
         if not input_folder:
             return
 
-        for input_file in input_files:
-            extention = os.path.splitext(input_file)[1]
-            outputpath = os.path.join(input_folder, output_folder, os.path.splitext(input_file)[0])
-            if not os.path.exists(os.path.join(input_folder, output_folder)):
-                os.makedirs(os.path.join(input_folder, output_folder))
-
-            if extention not in [".txt", ".json"]:
-                continue
-            with open(input_file, mode="r", encoding="utf-8") as f:
-                try:
-                    json_data = json.load(f)
-                    lattice, keywords = self.trans.tr_edit_lattice(json_data)
-                except Exception as err:
-                    print(input_file + "でエラー(" + str(err) + ")")
-                    continue
-
-            self.file_output(self.lattice2csv(lattice), outputpath + ".csv")
-
-            lattice1 = self.trans_original.execute(lattice, [], force_trans=False)
-            self.file_output(self.lattice2csv(lattice1), outputpath + "(arabia1).csv")
-
-            # lattice2 = self.trans.execute(lattice, [], force_trans=False)
-            # self.file_output(self.lattice2csv(lattice2), outputpath + "(arabia2).csv")
-            #
-            lattice3 = self.trans_original.execute(lattice, [], force_trans=True)
-            self.file_output(self.lattice2csv(lattice3), outputpath + "(force_arabia).csv")
-
-            result = {}
-            tag = ""
-            for ext in [".csv", "(arabia1).csv", "(force_arabia).csv"]:  # , "(arabia2).csv"]:
-                with codecs.open(outputpath + ext, "r", "utf-8-sig") as f:
-                    if ext == ".csv":
-                        # continue
-                        tag = "4.アラビア変換無し"
-                    elif ext == "(arabia1).csv":
-                        # continue
-                        tag = "1.アラビア変換－１"
-                    # elif ext == "(arabia2).csv":
-                    #     # continue
-                    #     tag = "2.アラビア変換－２"
-                    elif ext == "(force_arabia).csv":
-                        # continue
-                        tag = "3.強制アラビア変換"
-                    for i, line in enumerate(f):
-                        if i > 0 and len(target_list.findall(line.split(",")[2])) > 0:
-                            if input_file not in result:
-                                result.setdefault(input_file, [])
-                            data = line.split(",")
-                            result[input_file].append([float(data[0])] +
-                                                      [data[1]] +
-                                                      [tag] +
-                                                      data[-1:])
-
-            for file, data in result.items():
-                result[file].sort()
-
-            before_data0 = ""
-            for file, datas in result.items():
-                for data in datas:
-                    if before_data0 != str(data[0]):
-                        data[0] = str(data[0])
-                        before_data0 = str(data[0])
-                    else:
-                        data[0] = ""
-
-            with codecs.open(os.path.join(output_folder, "result.csv"), "a", "utf-8-sig") as o:
-                for file, data in result.items():
-                    o.write(file + "\n")
-                    for x in data:
-                        o.write(", ".join(x))
-                o.write("\n")
+        # 数字を含む行の抽出とresult.csvの集計は変換後のLatticeから直接行う
+        batch.process_folder(self.trans_original, input_folder, output_folder, write_csv=True)
 
         dialog = wx.MessageDialog(parent=frame,
                                   message="フォルダ" + output_folder + "にファイルを出力しました。" +
@@ -475,47 +398,10 @@ class Commands(object):
         dialog.Destroy()
 
     def lattice2csv(self, lattice):
-        transcription_result = []
-
-        for speaker in lattice:
-            for words in lattice[speaker]:
-                    transcription_result.append([lattice[speaker][words]["start"],
-                                                 lattice[speaker][words]["best_path"],
-                                                 lattice[speaker][words].get("speaker", "1"),
-                                                 lattice[speaker][words]["word"]])
-        transcription_result.sort()
-
-        body = "開始時間,話者,内容"
-        speaker = -1
-
-        for lists in transcription_result:
-            if (lists[3] != "!NULL" and
-                    lists[3] != "!ENTER" and
-                    lists[3] != "!EXIT" and
-                    lists[3] != "はい" and
-                    lists[3] != "はいはい" and
-                    lists[3] != "あー" and
-                    lists[3] != "あぁ" and
-                    # lists[3] != "。" and
-                    # lists[3] != "、" and
-                    lists[1] is True):
-
-                lists[3] = lists[3].replace("＋", "+")
-                # lists[3] = lists[3].replace("-", "―")
-                if lists[2] == speaker:
-                    body = body[:len(body) - 1] + str(lists[3]) + "\""
-                else:
-                    body += "\n" + str(lists[0]) + \
-                            ",話者:" + str(lists[2]) + \
-                            "," + "\"" + str(lists[3]) + "\""
-                speaker = lists[2]
-
-        return body
+        return batch.lattice2csv(lattice)
 
     def file_output(self, data, output_file):
-        o = codecs.open(output_file, "w", "utf-8-sig")
-        o.write(data)
-        o.close()
+        batch.file_output(data, output_file)
 
 
 if __name__ == '__main__':
@@ -2,20 +2,6 @@
 import re
 import copy
 import random
-import time
-
-
-def document_it(func):
-    def new_function(*args, **kwargs):
-        print('-' * 40)
-        print('Running function:', func.__name__)
-        t1_start = time.perf_counter()
-        result = func(*args, **kwargs)
-        t1_stop = time.perf_counter()
-        print("Elapsed time:", t1_stop - t1_start, "[sec]")
-        print('-' * 40)
-        return result
-    return new_function
 
 
 class Kansuji2Arabic(object):
@@ -49,7 +35,6 @@ class Kansuji2Arabic(object):
                 "単位": ""
             }
 
-    # @document_it
     def execute(self, lattice_obj, force_trans=False):
         self.force_trans = force_trans
         word = "一二三四五六七八九〇零十百千０１２３４５６７８９"
@@ -3,9 +3,15 @@
 
 import re
 import copy
+import atexit
+import functools
+import threading
+import collections
+import concurrent.futures
 import random
 import time
 import json
+import hashlib
 # import pdb
 import os
 import codecs
@@ -13,6 +19,10 @@ import tempfile
 from logging.handlers import RotatingFileHandler
 import logging
 
+# src.arabic_originalとして読み込むモジュール(直接は実行しない。性能の測定は python -m src.benchmark で行う)
+from src import exclusion
+from src import unit_index
+
 logger_name = "arabia_configs"
 log_level = logging.WARNING  # またはlogging.INFO
 log_file = "arabia_configs.log"
@@ -30,22 +40,556 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 
-def document_it(func):
-    def new_function(*args, **kwargs):
-        print('-' * 40)
-        print('Running function:', func.__name__)
-        t1_start = time.perf_counter()
-        result = func(*args, **kwargs)
-        t1_stop = time.perf_counter()
-        print("Elapsed time:", t1_stop - t1_start, "[sec]")
-        print('-' * 40)
-        return result
-    return new_function
+# digit_action()の区切り規則。千、百、十の前の単語(before_word)と２つ前の単語(before_word2)の条件
+DIGIT_CHECK_WORDS = {
+    "千": {
+        "before_word": ["千", "百", "十", "〇", "零", "０"],
+        "before_word2": ["千", "百", "十"]
+    },
+    "百": {
+        "before_word": ["百", "十", "一", "１", "〇", "零", "０"],
+        "before_word2": ["百", "十"]
+    },
+    "十": {
+        "before_word": ["十", "一", "１", "〇", "零", "０"],
+        "before_word2": ["十"]
+    }
+}
+# １～９。\dは全角「０」も対象になってしまう
+DIGIT_ONE_TO_NINE = re.compile(r'[一二三四五六七八九１２３４５６７８９]+')
+
+# 区切り規則の上で同じ扱いになる文字をまとめた文字種。""は直前の文字が無い状態、"*"はそれ以外の文字
+DIGIT_CLASSES = {"": "", "千": "千", "百": "百", "十": "十",
+                 "一": "一", "１": "一", "〇": "〇", "零": "〇", "０": "〇"}
+DIGIT_CLASSES.update({x: "二" for x in "二三四五六七八九２３４５６７８９"})
+DIGIT_OTHER_CLASS = "*"
+
+
+def digit_action(current_word, before_word, before_word2):
+    """１文字ずつ読む場合の区切り規則。current_wordを一時変数に追加する前に必要な更新を返す。
+    "flush": １つ前の単語まで更新、"remain2word": ２つ前の単語まで更新、
+    "isolate": １つ前の単語まで更新し、current_wordを追加した後にも更新、"": 更新しない
+    """
+    # 千、百、十の場合
+    if current_word in DIGIT_CHECK_WORDS:
+        # １つ前の単語が 現在の単語以下の単位だった場合か１(単語が千だった場合を除く)、０だった場合は１つ前の単語まで更新
+        if before_word in DIGIT_CHECK_WORDS[current_word]["before_word"]:
+            return "flush"
+        # ２つ前の単語が 現在の単語以下の単位だった場合は２つ前の単語まで更新
+        elif before_word2 in DIGIT_CHECK_WORDS[current_word]["before_word2"]:
+            # ただし千の場合で一つ前の単語が１の場合は１つ前の単語まで更新(「一千」⇒「1000」の対応)
+            if current_word == "千" and before_word in ["一", "１"]:
+                return "flush"
+            return "remain2word"
+        return ""
+    # １～９の場合
+    elif DIGIT_ONE_TO_NINE.findall(current_word):
+        # １つ前の単語も１～９だった場合は１つ前の単語まで更新
+        if DIGIT_ONE_TO_NINE.findall(before_word):
+            return "flush"
+        return ""
+    # 〇零０のどれか、または漢数字以外の文字の場合
+    return "isolate"
+
+
+def _compile_digit_transitions():
+    """文字種ごとにdigit_action()を評価し、(２つ前, １つ前, 現在の文字種) ⇒ (更新, 次の状態)の遷移表を作る"""
+    # 各文字種の代表の文字
+    representative = {x: x for x in ["", "千", "百", "十", "一", "二", "〇"]}
+    representative[DIGIT_OTHER_CLASS] = "あ"
+
+    transitions = {}
+    for before_class2 in representative:
+        for before_class in representative:
+            for current_class in representative:
+                if not current_class:
+                    continue
+                action = digit_action(representative[current_class],
+                                      representative[before_class],
+                                      representative[before_class2])
+                if action == "flush":
+                    next_state = ("", current_class)
+                elif action == "isolate":
+                    next_state = ("", "")
+                # ２つ前の単語まで更新した場合も１つ前の単語は一時変数に残る
+                else:
+                    next_state = (before_class, current_class)
+                transitions[(before_class2, before_class, current_class)] = (action, next_state)
+    return transitions
+
+
+DIGIT_TRANSITIONS = _compile_digit_transitions()
 
 
-class Kansuji2Arabic(object):
-    """漢数字⇒アラビア数字への変換クラス"""
-    def __init__(self):
+@functools.lru_cache(maxsize=65536)
+def compile_digit_word(word, state):
+    """単語全体を遷移表で読み、一時変数への追加("add", 文字列)と
+    update_return_lattice()の呼び出し("flush", remain2word)の手順と、読み終わった後の状態を返す。
+    stateは(２つ前の文字種, １つ前の文字種)。
+    """
+    steps = []
+    text = ""
+    for x in word:
+        action, state = DIGIT_TRANSITIONS[state + (DIGIT_CLASSES.get(x, DIGIT_OTHER_CLASS),)]
+        if action:
+            if text:
+                steps.append(("add", text))
+                text = ""
+            steps.append(("flush", action == "remain2word"))
+            if action == "isolate":
+                steps.append(("add", x))
+                steps.append(("flush", False))
+                continue
+        text += x
+    if text:
+        steps.append(("add", text))
+    return tuple(steps), state
+
+
+# 数字系の文字を全て半角数字に変換する変換表
+KANSUJI_TRANS_TABLE = str.maketrans('一二三四五六七八九〇零１２３４５６７８９０',
+                                    '123456789001234567890')
+# 千百十の位の単位
+SMALL_UNITS = {'十': 10, '百': 100, '千': 1000}
+# 万億兆の位の単位
+LARGE_UNITS = {'万': 10 ** 4, '億': 10 ** 8, '兆': 10 ** 12}
+# 小数点や桁区切りの文字。この直後の数字には万億兆を掛けない(「2.5万」の「5万」だけを変換しないため)
+NUMBER_SEPARATORS = frozenset('.,点．，')
+
+
+def parse_kansuji(word, sep=False):
+    """渡された文字列の漢数字をアラビア数字へ変換して返す関数。sep=Trueで３桁ごとにカンマを付ける。
+    文字列を先頭から１回だけ読み、十百千に加えて万億兆の位にも対応する。
+    十百千は数字の並びごとに位取りし、万億兆は直前に数値がある場合のみ単位として扱う
+    (「万が一」の「万」のように単独の万億兆は変換しない)。
+    小数点や桁区切り(「2.5万」「二点五万」「1,000万」)の後の数字の並びでは万億兆を単位として扱わず、そのまま残す。
+    万億兆が大きい順に並んでいない数字の並び(「十二万三千億」)と、位の値が0の数字の並び(「〇万」)は
+    単位が失われないように変換せず、元の文字のまま残す。
+    """
+    text = word.translate(KANSUJI_TRANS_TABLE)
+    length = len(text)
+    result = []
+    i = 0
+    while i < length:
+        x = text[i]
+        if x not in SMALL_UNITS and not x.isdecimal():
+            result.append(x)
+            i += 1
+            continue
+
+        # 連続した数字と単位を読む
+        start = i
+        # 小数点や桁区切りの後の数字の並びでは万億兆を単位として扱わない
+        allow_large = start == 0 or text[start - 1] not in NUMBER_SEPARATORS
+        total = 0  # 万億兆の位まで確定した値
+        section = 0  # 千百十の位の値
+        number = None  # 単位が付いていない数字
+        has_token = False  # 千百十の位に数字か単位があるか
+        has_unit = False
+        large_unit = None  # 直前の万億兆の値
+        valid = True  # 万億兆が大きい順に並び、位の値が0ではないか
+        while i < length:
+            x = text[i]
+            if x.isdecimal():
+                end = i + 1
+                while end < length and text[end].isdecimal():
+                    end += 1
+                number = int(text[i:end])
+                has_token = True
+                i = end
+            elif x in SMALL_UNITS:
+                # 単位の前に数字がある場合は掛け算、無い場合は単位だけ足す
+                if number is not None:
+                    section += number * SMALL_UNITS[x]
+                    number = None
+                else:
+                    section += SMALL_UNITS[x]
+                has_token = True
+                has_unit = True
+                i += 1
+            elif x in LARGE_UNITS and has_token and allow_large:
+                if number is not None:
+                    section += number
+                    number = None
+                if section == 0 or (large_unit is not None and LARGE_UNITS[x] >= large_unit):
+                    valid = False
+                large_unit = LARGE_UNITS[x]
+                total += section * large_unit
+                section = 0
+                has_token = False
+                has_unit = True
+                i += 1
+            else:
+                break
+        if number is not None:
+            section += number
+        total += section
+
+        # 単位を含まない数字の並びはそのまま
+        if not has_unit:
+            result.append(text[start:i])
+        elif not valid:
+            result.append(word[start:i])
+        else:
+            result.append('{:,}'.format(total) if sep else str(total))
+    return "".join(result)
+
+
+class LRUCache(object):
+    """サイズ上限付きのキャッシュクラス。上限を超えた場合は最も長く使われていない値から追い出す(LRU)。
+    ヒット数、ミス数、追い出し数を数える。複数スレッドから使用可能。
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, func, *args):
+        """keyの値を返すメソッド。キャッシュに無い場合はfunc(*args)の結果をキャッシュしてから返す"""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = func(*args)
+
+        with self._lock:
+            if self.maxsize > 0:
+                self._data[key] = value
+                self._evict()
+        return value
+
+    def resize(self, maxsize):
+        """キャッシュの上限を変更するメソッド。上限を超えた分は追い出す"""
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """キャッシュと集計値をクリアするメソッド"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """集計値を返すメソッド"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "maxsize": self.maxsize,
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def _evict(self):
+        while len(self._data) > max(self.maxsize, 0):
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+# kansuji2arabic()の変換結果のキャッシュ(プロセス全体で共有)。
+# 上限はNUMERAL_CACHE.resize()で変更し、NUMERAL_CACHE.stats()でヒット率を確認する
+NUMERAL_CACHE = LRUCache(maxsize=4096)
+
+
+def parse_arabia_configs(path):
+    """設定ファイルを読み込み、(設定, 読み込めたかどうか)を返す関数。
+    読み込めなかった場合の設定は除外単語と単位が空になる
+    """
+    setting = {
+        "除外単語": [],
+        "単位": ""
+    }
+    loaded = False
+
+    config_filename = os.path.basename(path)
+    # encodingを"utf-8-sig"にすればBOM有り無しに関わらず読み込める
+    for encode in ["utf_8_sig", "shift_jis"]:
+        try:
+            logger.info("アラビア変換設定を読み込み(encoding=" + encode + "): " + path)
+            with codecs.open(path, mode="r", encoding=encode) as f:
+                json_data = json.load(f)
+        except UnicodeDecodeError as err:
+            logger.warning(config_filename + "の文字コードが" + encode + "ではありません。: "
+                           + str(type(err).__name__) + ": " + str(err))
+            continue
+        except json.decoder.JSONDecodeError as err:
+            logger.error(config_filename + "がJSON形式になっていません。: "
+                         + str(type(err).__name__) + ": " + str(err))
+            break
+        except FileNotFoundError as err:
+            logger.error("アラビア変換設定ファイルが見つかりません。: "
+                         + str(type(err).__name__) + ": " + str(err))
+            break
+        except Exception as err:
+            logger.error("予期しないエラーが発生しました。: "
+                         + str(type(err).__name__) + ": " + str(err))
+            break
+        # JSON読み込みに成功した時の処理
+        else:
+            # 単位は文字列(１文字ずつが単位)か、複数文字の単位を含むリスト
+            params = {
+                "除外単語": (list,),
+                "単位": (str, list)
+            }
+            for key, data_classes in params.items():
+                data_class = data_classes[0]
+                if key not in json_data:
+                    setting[key] = data_class()
+                    logger.error(config_filename + "に" + key + "の設定がありません。")
+                elif type(json_data[key]) in data_classes:
+                    setting[key] = json_data[key]
+                # 設定形式(配列 or 文字列)が不正な場合はエラー
+                else:
+                    setting[key] = data_class()
+                    logger.error(key + "の設定が"
+                                 + str(type(json_data[key]).__name__)
+                                 + "形式になっています。"
+                                 + str(data_class.__name__) + "形式で設定してください。")
+
+            # 重複しているデータを削除
+            setting["除外単語"] = list(set(setting["除外単語"]))
+            if isinstance(setting["単位"], str):
+                setting["単位"] = "".join(set(setting["単位"]))
+            else:
+                setting["単位"] = list(set(unit for unit in setting["単位"] if isinstance(unit, str) and unit))
+            loaded = True
+            break
+    logger.info("除外単語数: " + str(len(setting["除外単語"]))
+                + ", 単位数: " + str(len(setting["単位"])))
+    return setting, loaded
+
+
+# 設定ファイルの名前
+CONFIG_FILENAME = "arabia_configs.json"
+# 設定ファイルが更新されたかを確認する間隔(秒)
+CONFIG_CHECK_INTERVAL = 1.0
+
+# 変換対象となる文字
+KANSUJI_TARGET = re.compile('[一二三四五六七八九〇零十百千０１２３４５６７８９]')
+
+# コンパイル済みの設定ファイル(compile_config()の結果を保存したファイル)の拡張子と形式
+COMPILED_CONFIG_SUFFIX = ".compiled"
+COMPILED_CONFIG_MAGIC = b"ARABIACF"
+# CompiledConfigの内容を変えた場合は上げる(古い形式のファイルは読み込まずに作り直す)
+COMPILED_CONFIG_FORMAT = 3
+
+
+def config_version(setting):
+    """変換設定の版(内容のハッシュ値)を返す関数。除外単語と単位は順番によらず同じ値になる"""
+    normalized = {key: sorted(value) if isinstance(value, (list, str)) else value
+                  for key, value in setting.items()}
+    text = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def compile_not_allow(unit_chars):
+    """変換対象外の文字の正規表現を返す関数"""
+    return re.compile(r'[^一二三四五六七八九〇零、.。,\d' + r'あ-んア-ヴｦ-ﾟa-zA-Zａ-ｂＡ-Ｚ' + re.escape(unit_chars) + ']')
+
+
+class CompiledConfig(object):
+    """変換設定と、設定から作る正規表現・単位のUnitIndex・除外単語のExclusionIndexをまとめたクラス。
+    設定を読み込んだ時に１回だけ作り、変換の度に使い回す。中身は変更しないこと。
+    """
+    __slots__ = ("setting", "version", "target", "not_allow", "units", "exclusion")
+
+    def __init__(self, setting):
+        self.setting = setting
+        self.version = config_version(setting)
+        self.target = KANSUJI_TARGET
+        self.units = unit_index.UnitIndex(setting["単位"])
+        self.not_allow = compile_not_allow(self.units.chars)
+        self.exclusion = exclusion.ExclusionIndex(setting["除外単語"])
+
+    def to_json(self):
+        """保存用に、JSONにできる辞書にして返すメソッド(正規表現は読み込み時に作り直す)"""
+        return {"setting": self.setting, "version": self.version,
+                "units": self.units.to_json(), "exclusion": self.exclusion.to_json()}
+
+    @classmethod
+    def from_json(cls, data):
+        """to_json()の結果から、トライ木を作り直さずにCompiledConfigを作るメソッド"""
+        compiled = cls.__new__(cls)
+        compiled.setting = data["setting"]
+        compiled.version = str(data["version"])
+        compiled.target = KANSUJI_TARGET
+        compiled.units = unit_index.UnitIndex.from_json(data["units"])
+        compiled.not_allow = compile_not_allow(compiled.units.chars)
+        compiled.exclusion = exclusion.ExclusionIndex.from_json(data["exclusion"])
+        return compiled
+
+
+def compile_config(setting):
+    """設定(parse_arabia_configs()の結果)からCompiledConfigを作る関数"""
+    return CompiledConfig(setting)
+
+
+def compiled_config_path(path):
+    """設定ファイルのコンパイル済みファイルのパスを返す関数(設定ファイルと同じフォルダに置く)"""
+    return os.path.splitext(path)[0] + COMPILED_CONFIG_SUFFIX
+
+
+def write_compiled_config(compiled, output_path, stamp):
+    """CompiledConfigをファイルに保存する関数。stampは元の設定ファイルの更新時刻とサイズ。
+    読み込む時にコードを実行することが無いように、pickleではなくJSONで保存する
+    """
+    data = {"format": COMPILED_CONFIG_FORMAT, "stamp": list(stamp), "config": compiled.to_json()}
+    temp_path = output_path + ".tmp" + str(os.getpid())
+    with open(temp_path, mode="wb") as f:
+        f.write(COMPILED_CONFIG_MAGIC)
+        f.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+    # 書き込み途中のファイルを読まないように、書き終わってから置き換える
+    os.replace(temp_path, output_path)
+
+
+def read_compiled_config(input_path, stamp):
+    """保存したCompiledConfigを読み込む関数。
+    ファイルが無い・形式が古い・元の設定ファイルが保存後に更新されている場合はNoneを返す
+    """
+    try:
+        with open(input_path, mode="rb") as f:
+            if f.read(len(COMPILED_CONFIG_MAGIC)) != COMPILED_CONFIG_MAGIC:
+                return None
+            data = json.loads(f.read().decode("utf-8"))
+        if data["format"] != COMPILED_CONFIG_FORMAT or stamp is None or tuple(data["stamp"]) != stamp:
+            return None
+        return CompiledConfig.from_json(data["config"])
+    except FileNotFoundError:
+        return None
+    except Exception as err:
+        logger.warning("コンパイル済みの設定ファイルを読み込めません。: " + input_path + ": "
+                       + str(type(err).__name__) + ": " + str(err))
+        return None
+
+
+def build_compiled_config(path, stamp=None, save=True):
+    """設定ファイルのCompiledConfigを返す関数。コンパイル済みのファイルがあれば読み込み、
+    無い場合は設定ファイルを読み込んでコンパイルし、save=Trueならコンパイル済みのファイルを保存する。
+    (CompiledConfig, 読み込めたかどうか)を返す。
+    """
+    if stamp is None:
+        stamp = config_stamp(path)
+    output_path = compiled_config_path(path)
+    compiled = read_compiled_config(output_path, stamp)
+    if compiled is not None:
+        logger.info("コンパイル済みのアラビア変換設定を読み込み: " + output_path)
+        return compiled, True
+
+    setting, loaded = parse_arabia_configs(path)
+    compiled = compile_config(setting)
+    if loaded and save and stamp is not None:
+        try:
+            write_compiled_config(compiled, output_path, stamp)
+        except OSError as err:
+            # 保存できない場合(書き込み権限が無いなど)は毎回設定ファイルから読み込む
+            logger.warning("コンパイル済みの設定ファイルを保存できません。: " + output_path + ": "
+                           + str(type(err).__name__) + ": " + str(err))
+    return compiled, loaded
+
+
+# load_compiled_config()で読み込んだ設定(プロセス全体で共有)。
+# {パス: (ファイルの更新時刻とサイズ, CompiledConfig, 確認した時刻)}
+_config_cache = {}
+_config_lock = threading.Lock()
+
+
+def config_stamp(path):
+    """設定ファイルの更新を確認するための値(更新時刻とサイズ)を返す関数。ファイルが無い場合はNone"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_compiled_config(path, check_interval=CONFIG_CHECK_INTERVAL):
+    """設定ファイルのCompiledConfigを返す関数。読み込んだ設定はプロセス全体で共有し、
+    前回の確認からcheck_interval秒以上経っていてファイルの更新時刻かサイズが変わっていた場合だけ読み込み直す。
+    変換中の処理は変換開始時の設定を使い続ける。
+    読み込み直しに失敗した場合(書き込み途中など)は前回の設定を使う。
+    """
+    entry = _config_cache.get(path)
+    now = time.monotonic()
+    if entry is not None and now - entry[2] < check_interval:
+        return entry[1]
+
+    with _config_lock:
+        entry = _config_cache.get(path)
+        if entry is not None and now - entry[2] < check_interval:
+            return entry[1]
+        stamp = config_stamp(path)
+        if entry is not None and stamp == entry[0]:
+            _config_cache[path] = (stamp, entry[1], now)
+            return entry[1]
+
+        compiled, loaded = build_compiled_config(path, stamp)
+        if not loaded and entry is not None:
+            logger.error("アラビア変換設定を読み込み直せなかったため、前回の設定を使います。: " + path)
+            compiled = entry[1]
+        elif entry is not None:
+            logger.warning("アラビア変換設定を読み込み直しました。: " + path)
+        _config_cache[path] = (stamp, compiled, now)
+        return compiled
+
+
+def load_arabia_configs(path, check_interval=CONFIG_CHECK_INTERVAL):
+    """設定ファイルの設定を返す関数(load_compiled_config()の設定部分)。返した設定の中身は変更しないこと"""
+    return load_compiled_config(path, check_interval).setting
+
+
+# execute()のspeaker_workersで、リンク数の合計がこの値以上の場合だけ話者ごとにプロセスで並列化する
+# (未満の場合はLatticeの受け渡しの分だけ遅くなるため、このプロセスで順に変換する)
+SPEAKER_PROCESS_THRESHOLD = 20000
+
+# compile_exclusion()で作ったaddwordsを含むExclusionIndexのキャッシュ(プロセス全体で共有)。
+# キーは(CompiledConfigのid, addwords)。値にCompiledConfigを入れて保持するため、idが他の設定と重なることは無い
+EXCLUSION_CACHE = LRUCache(maxsize=64)
+
+
+def _build_exclusion(config, addwords):
+    return config, exclusion.ExclusionIndex(list(config.setting["除外単語"]) + list(addwords))
+
+
+# copy_links()でリンクの辞書だけをコピーする値の型(変更できない値)
+SCALAR_TYPES = frozenset([str, int, float, bool, type(None)])
+
+
+def copy_links(lattices):
+    """１話者分のLattice(IDとリンクの辞書)をcopy.deepcopy()と同じ内容で複製する関数。
+    リンクの値が全て文字列・数値などの変更できない値の場合はリンクの辞書だけをコピーし、
+    それ以外の値を含むリンクだけをcopy.deepcopy()する。
+    """
+    links = {}
+    for link_id, link in lattices.items():
+        if SCALAR_TYPES.issuperset(map(type, link.values())):
+            links[link_id] = dict(link)
+        else:
+            links[link_id] = copy.deepcopy(link)
+    return links
+
+
+class ConversionContext(object):
+    """Kansuji2Arabicの変換処理１回分の作業用の状態を保持するクラス。
+    変換処理ごとに作るため、同じKansuji2Arabicのインスタンスを複数のスレッドから同時に使える。
+    """
+    def __init__(self, return_lattice, addwords, copy_on_write=False, config=None):
+        # 変換開始時の設定のCompiledConfig(変換中に設定ファイルが読み込み直されても変わらない)
+        self.config = config
+
         self.new_word = ""
         self.update_lattice_ids = []
         self.before_word = ""
@@ -54,333 +598,399 @@ class Kansuji2Arabic(object):
         self.insert_space = False
         self.before_first_id = ""
 
-        self.return_lattice = None
+        self.return_lattice = return_lattice
         self.speaker = 1
 
-        self.addwords = []
+        self.addwords = addwords
+
+        # copy_on_write=Trueの場合に、コピー済みの(話者, ID)を保持する
+        self.copy_on_write = copy_on_write
+        self.copied_ids = set()
+
+    def get_word(self, speaker, word_id):
+        """変換中のLatticeの単語を返すメソッド"""
+        return self.return_lattice[speaker][word_id]["word"]
+
+    def set_word(self, speaker, word_id, word):
+        """変換中のLatticeの単語を更新するメソッド。
+        copy_on_write=Trueの場合は、リンクの辞書を最初の更新時にだけコピーする。
+        """
+        lattices = self.return_lattice[speaker]
+        if self.copy_on_write and (speaker, word_id) not in self.copied_ids:
+            lattices[word_id] = dict(lattices[word_id])
+            self.copied_ids.add((speaker, word_id))
+        lattices[word_id]["word"] = word
+
 
+class ColumnsContext(ConversionContext):
+    """SpeakerColumnsの単語の列を変換する場合のConversionContext。単語は位置(インデックス)で参照する"""
+    def __init__(self, words, addwords, config=None):
+        super().__init__(None, addwords, config=config)
+        self.words = words
+
+    def get_word(self, speaker, word_id):
+        return self.words[word_id]
+
+    def set_word(self, speaker, word_id, word):
+        self.words[word_id] = word
+
+
+class Kansuji2Arabic(object):
+    """漢数字⇒アラビア数字への変換クラス。
+    インスタンスは設定のみを保持し、変換中の状態は呼び出しごとのConversionContextに持つため、
+    １つのインスタンスを複数のスレッドで共有できる。
+    """
+    def __init__(self, setting=None, config_path=None):
+        """settingに設定(load_arabia_configs()の結果)を渡した場合は設定ファイルを読み込まない。
+        渡さない場合はconfig_path(省略時は実行時のフォルダのarabia_configs.json)を読み込む。
+        設定ファイルの内容はプロセス全体で共有し、ファイルが更新された場合は次の変換から新しい設定を使う。
+        """
         # 現在は未使用
         self.omit_list1 = ["第"]
         self.omit_list2 = ["章", "段"]
 
-        self.setting = {}
+        self._config = None
+        self._config_path = None
 
-        self.read_arabia_configs()
+        if setting is None:
+            self.read_arabia_configs(config_path)
+        else:
+            self.setting = setting
 
-    def read_arabia_configs(self):
-        self.setting = {
-            "除外単語": [],
-            "単位": ""
-        }
+    def read_arabia_configs(self, config_path=None):
+        """設定ファイルを読み込むメソッド。以降は設定ファイルが更新されると自動的に読み込み直す。
+        config_pathを省略した場合は実行時のフォルダのarabia_configs.jsonを読み込む
+        """
+        self._config = None
+        self._config_path = os.path.abspath(config_path or os.path.join(os.getcwd(), CONFIG_FILENAME))
+        load_compiled_config(self._config_path, check_interval=0)
+
+    @property
+    def config(self):
+        """現在の設定のCompiledConfig。設定ファイルを読み込んだ場合はload_compiled_config()で最新の設定を返す"""
+        if self._config_path is None:
+            return self._config
+        return load_compiled_config(self._config_path)
+
+    @property
+    def setting(self):
+        """変換設定"""
+        return self.config.setting
+
+    @setting.setter
+    def setting(self, setting):
+        # 設定を直接指定した場合は設定ファイルを読み込まない
+        self._config = compile_config(setting)
+        self._config_path = None
+
+    @property
+    def config_path(self):
+        """読み込んだ設定ファイルのパス(設定を直接指定した場合はNone)"""
+        return self._config_path
+
+    def execute(self, lattice_obj, addwords, force_trans=False, fused=False, copy_on_write=False,
+                speaker_workers=None):
+        """Latticeの漢数字をアラビア数字に変換したLatticeを返すメソッド。
+        fused=Trueの場合は話者ごとの時間順を１回だけ求め、後処理をまとめて行う(結果は同じ)。
+        copy_on_write=Trueの場合は単語が変わったリンクの辞書だけを新しく作り、それ以外は引数の
+        Latticeと共有する(返したLatticeの中身を書き換えると引数のLatticeも変わるので注意)。
+        speaker_workersに2以上を指定した場合、話者が複数あり、リンク数の合計がSPEAKER_PROCESS_THRESHOLD以上なら
+        execute_parallel()で話者ごとに並列に変換する(その場合copy_on_writeは無視され、結果は常に新しい辞書になる)。
+        """
+        if (speaker_workers is not None and speaker_workers > 1 and len(lattice_obj) > 1
+                and sum(len(lattices) for lattices in lattice_obj.values()) >= SPEAKER_PROCESS_THRESHOLD):
+            return self.execute_parallel(lattice_obj, addwords, force_trans=force_trans, workers=speaker_workers)
 
-        config_filename = "arabia_configs.json"
-        arabia_configs_path = os.path.join(os.path.abspath(os.getcwd()), config_filename)
-        # encodingを"utf-8-sig"にすればBOM有り無しに関わらず読み込める
-        for encode in ["utf_8_sig", "shift_jis"]:
-            try:
-                logger.info("アラビア変換設定を読み込み(encoding=" + encode + "): " + arabia_configs_path)
-                with codecs.open(arabia_configs_path, mode="r", encoding=encode) as f:
-                    json_data = json.load(f)
-            except UnicodeDecodeError as err:
-                logger.warning(config_filename + "の文字コードが" + encode + "ではありません。: "
-                               + str(type(err).__name__) + ": " + str(err))
-                continue
-            except json.decoder.JSONDecodeError as err:
-                logger.error(config_filename + "がJSON形式になっていません。: "
-                             + str(type(err).__name__) + ": " + str(err))
-                break
-            except FileNotFoundError as err:
-                logger.error("アラビア変換設定ファイルが見つかりません。: "
-                             + str(type(err).__name__) + ": " + str(err))
-                break
-            except Exception as err:
-                logger.error("予期しないエラーが発生しました。: "
-                             + str(type(err).__name__) + ": " + str(err))
-                break
-            # JSON読み込みに成功した時の処理
-            else:
-                params = {
-                    "除外単語": list,
-                    "単位": str
-                }
-                for key, data_class in params.items():
-                    if key not in json_data:
-                        self.setting[key] = data_class()
-                        logger.error(config_filename + "に" + key + "の設定がありません。")
-                    elif type(json_data[key]) == data_class:
-                        self.setting[key] = json_data[key]
-                    # 設定形式(配列 or 文字列)が不正な場合はエラー
-                    else:
-                        self.setting[key] = data_class()
-                        logger.error(key + "の設定が"
-                                     + str(type(json_data[key]).__name__)
-                                     + "形式になっています。"
-                                     + str(data_class.__name__) + "形式で設定してください。")
-
-                # 重複しているデータを削除
-                self.setting["除外単語"] = list(set(self.setting["除外単語"]))
-                self.setting["単位"] = "".join(set(self.setting["単位"]))
-                break
-        logger.info("除外単語数: " + str(len(self.setting["除外単語"]))
-                    + ", 単位数: " + str(len(self.setting["単位"])))
+        config = self.config
+        target_list, not_allow_list = self.compile_patterns(config)
 
-    # @document_it
-    def execute(self, lattice_obj, addwords, force_trans=False):
-        self.addwords = addwords
-        word = "一二三四五六七八九〇零十百千０１２３４５６７８９"
-        target_list = re.compile('[' + word + ']')
-        not_allow_list = re.compile(r'[^一二三四五六七八九〇零、.。,\d' +
-                                    r'あ-んア-ヴｦ-ﾟa-zA-Zａ-ｂＡ-Ｚ' + self.setting['単位'] + ']')
-        # tt_ksuji = str.maketrans('1234567890', '１２３４５６７８９０')
+        if copy_on_write:
+            # 話者ごとの辞書だけ作り直し、各リンクの辞書は単語を更新する時にコピーする
+            return_lattice = {speaker: dict(lattices) for speaker, lattices in lattice_obj.items()}
+        else:
+            # 引数で渡されたLatticeをごっそりコピー。copy_links()はcopy.deepcopy()と同じく参照渡しじゃなくなる。
+            return_lattice = {speaker: copy_links(lattices) for speaker, lattices in lattice_obj.items()}
+        # 変換中の状態は呼び出しごとに作る
+        ctx = ConversionContext(return_lattice, addwords, copy_on_write=copy_on_write, config=config)
 
-        # 引数で渡されたLatticeをごっそりコピー。copy.deepcopy()を使うと参照渡しじゃなくなる。
-        self.return_lattice = copy.deepcopy(lattice_obj)
+        # fused=Trueの場合に後処理で使い回す話者ごとの開始時間と時間順のID一覧
+        orders = {}
 
         # 各話者ごとにLatticeを読み込む
-        for self.speaker, lattices in lattice_obj.items():
-            # 一時変数のクリア
-            self.temp_value_clear()
-            self.insert_space = False
-            self.before_first_id = ""
-
-            # Latticeの単語を順次読み込む
-            for current_id, current_data in sorted(lattices.items(),
-                                                   key=lambda x: float(x[1]["start"])):
-                # current_word = current_data["word"].translate(tt_ksuji)
-                current_word = current_data["word"]
-                # 対象となる文字を正規表現で検索
-                kansuji = target_list.findall(current_word)
-                not_allow = not_allow_list.findall(current_word)
-
-                if current_word in ["!NULL", "!ENTER", "!EXIT"]:
-                    # 2秒未満の!NULL !ENTER !EXITは無視するようにしていたが、時間に関わらず無視してよい
-                    # とのことで修正
-                    # word_time_length = float(current_data["end"]) - float(current_data["start"])
-                    # if word_time_length >= 2:
-                    #     self.update_return_lattice()
-                    #     self.insert_space = False
-                    continue
+        for ctx.speaker, lattices in lattice_obj.items():
+            if fused:
+                starts = {k: float(v["start"]) for k, v in lattices.items()}
+                order = sorted(lattices, key=starts.__getitem__)
+                orders[ctx.speaker] = (starts, order)
+                sorted_lattices = [(k, lattices[k]["word"]) for k in order]
+            else:
+                sorted_lattices = [(k, v["word"]) for k, v in sorted(lattices.items(),
+                                                                     key=lambda x: float(x[1]["start"]))]
 
-                # 単語がアラビア変換除外文字と一致しない場合
-                if current_word not in self.setting['除外単語'] + self.addwords and len(kansuji) > 0:
-                    if len(not_allow) == 0 or force_trans:
-                        # １文字ずつprocess_digit()に渡す
-                        for x in current_word:
-                            # 一時変数と現在の単語から、適切な単位で区切った上でアラビア変換する
-                            self.process_digit(current_word=x, current_id=current_id)
-                        continue
-                # 単語がアラビア変換除外文字と一致した場合、または 対象となる文字のみではなかった場合
-                # １つ前の単語まで更新
-                self.update_return_lattice()
-                self.insert_space = False
-            # 話者の単語を全て読み込んだ後、一時変数に値が残っていた場合はLatticeを更新してから次の話者へ
-            if self.new_word:
-                self.update_return_lattice()
+            self.convert_words(ctx, sorted_lattices, target_list, not_allow_list, force_trans)
 
         # 「第」の後のアラビア数字か、「段、章」の前のアラビア数字を漢数字へ戻す
-        # self.arabic2kansuji()
+        # self.arabic2kansuji(ctx)
+
+        if fused:
+            # 以下の４つの後処理を話者ごとの単語列に対してまとめて行う
+            for speaker, (starts, order) in orders.items():
+                self.fused_post_process(ctx, speaker, starts, order)
+            return ctx.return_lattice
 
         # 可能であれば「点」「、」を小数点にする
-        self.ten2period()
+        self.ten2period(ctx)
 
         # 一桁が２回続いた場合は「，」を間に入れる
-        self.consecutive_number_edit()
+        self.consecutive_number_edit(ctx)
 
         # 連続する一桁の数字は１つにまとめる
-        self.lattice_one_subst()
+        self.lattice_one_subst(ctx)
 
         # 半角スペースを適切な位置に入れる
-        self.lattice_space_edit()
-
-        return self.return_lattice
-
-    def process_digit(self, current_word, current_id):
-        """一時変数と現在の単語から、適切な単位で区切った上でアラビア変換するためのメソッド"""
-        check_words = {
-            "千": {
-                "before_word": ["千", "百", "十", "〇", "零", "０"],
-                "before_word2": ["千", "百", "十"]
-            },
-            "百": {
-                "before_word": ["百", "十", "一", "１", "〇", "零", "０"],
-                "before_word2": ["百", "十"]
-            },
-            "十": {
-                "before_word": ["十", "一", "１", "〇", "零", "０"],
-                "before_word2": ["十"]
-            }
-        }
+        self.lattice_space_edit(ctx)
 
-        # 千、百、十の場合
-        if current_word in check_words.keys():
-            # １つ前の単語が 現在の単語以下の単位だった場合か１(単語が千だった場合を除く)、０だった場合は１つ前の単語まで更新
-            if self.before_word in check_words[current_word]["before_word"]:
-                self.update_return_lattice()
-            # ２つ前の単語が 現在の単語以下の単位だった場合は２つ前の単語まで更新
-            elif self.before_word2 in check_words[current_word]["before_word2"]:
-                # ただし千の場合で一つ前の単語が１の場合は１つ前の単語まで更新(「一千」⇒「1000」の対応)
-                if current_word == "千" and self.before_word in ["一", "１"]:
-                    self.update_return_lattice()
-                else:
-                    self.update_return_lattice(remain2word=True)
-            # 現在の単語とキーを一時変数に追加
-            self.temp_value_add(current_word=current_word, update_lattice_ids=current_id)
-        # １～９の場合
-        elif re.findall(r'[一二三四五六七八九１２３４５６７８９]+', current_word):  # \dは全角「０」も対象になってしまう
-            # １つ前の単語も１～９だった場合は１つ前の単語まで更新
-            if re.findall(r'[一二三四五六七八九１２３４５６７８９]+', self.before_word):
-                self.update_return_lattice()
-            # 現在の単語とキーを一時変数に追加
-            self.temp_value_add(current_word=current_word, update_lattice_ids=current_id)
-        # 〇零０のどれか、または漢数字以外の文字の場合
-        else:  # current_word in ["〇", "零", "０"]:
+        return ctx.return_lattice
+
+    def compile_exclusion(self, addwords, config=None):
+        """除外単語とaddwordsのExclusionIndex(src/exclusion.py)を返すメソッド。
+        addwordsが無い場合はCompiledConfigのものを使い、ある場合は同じ設定とaddwordsの組み合わせでは
+        作り直さずに使い回す。configを省略した場合は現在の設定を使う。
+        """
+        if config is None:
+            config = self.config
+        if not addwords:
+            return config.exclusion
+        return EXCLUSION_CACHE.get((id(config), tuple(addwords)), _build_exclusion, config, addwords)[1]
+
+    def compile_patterns(self, config=None):
+        """変換対象の文字と、変換対象外の文字の正規表現を返すメソッド。configを省略した場合は現在の設定を使う"""
+        if config is None:
+            config = self.config
+        return config.target, config.not_allow
+
+    def compile_units(self, config=None):
+        """単位のUnitIndexを返すメソッド。configを省略した場合は現在の設定を使う"""
+        return (self.config if config is None else config).units
+
+    def convert_words(self, ctx, sorted_lattices, target_list, not_allow_list, force_trans=False):
+        """ctx.speakerの時間順の(ID, 単語)を読み込み、漢数字をアラビア数字に変換するメソッド"""
+        # 一時変数のクリア
+        self.temp_value_clear(ctx)
+        ctx.insert_space = False
+        ctx.before_first_id = ""
+
+        # 除外単語と一致する単語(連続する単語をつなげて一致するものを含む)の位置
+        excluded = self.compile_exclusion(ctx.addwords, ctx.config).covered([word for word_id, word in sorted_lattices])
+
+        # Latticeの単語を順次読み込む
+        for index, (current_id, current_word) in enumerate(sorted_lattices):
+            # current_word = current_word.translate(tt_ksuji)
+            # 対象となる文字を正規表現で検索
+            kansuji = target_list.findall(current_word)
+            not_allow = not_allow_list.findall(current_word)
+
+            if current_word in ["!NULL", "!ENTER", "!EXIT"]:
+                # 2秒未満の!NULL !ENTER !EXITは無視するようにしていたが、時間に関わらず無視してよい
+                # とのことで修正
+                # word_time_length = float(current_data["end"]) - float(current_data["start"])
+                # if word_time_length >= 2:
+                #     self.update_return_lattice(ctx)
+                #     ctx.insert_space = False
+                continue
+
+            # 単語がアラビア変換除外文字と一致しない場合
+            if index not in excluded and len(kansuji) > 0:
+                if len(not_allow) == 0 or force_trans:
+                    # 一時変数と現在の単語から、適切な単位で区切った上でアラビア変換する
+                    self.process_word(ctx, current_word=current_word, current_id=current_id)
+                    continue
+            # 単語がアラビア変換除外文字と一致した場合、または 対象となる文字のみではなかった場合
             # １つ前の単語まで更新
-            self.update_return_lattice()
-            # 現在の単語とキーを一時変数に追加
-            self.temp_value_add(current_word=current_word, update_lattice_ids=current_id)
-            # 現在の単語まで更新
-            self.update_return_lattice()
+            self.update_return_lattice(ctx)
+            ctx.insert_space = False
+        # 話者の単語を全て読み込んだ後、一時変数に値が残っていた場合はLatticeを更新してから次の話者へ
+        if ctx.new_word:
+            self.update_return_lattice(ctx)
+
+    def execute_speaker(self, speaker, lattices, addwords, force_trans=False, period=False, copy_on_write=False):
+        """１話者分のLattice(IDとリンクの辞書)を変換するメソッド。後処理はfused_post_process()で行う。
+        periodは直前までの単語で小数点が続いている状態かどうか(consecutive_number_edit()の状態)。
+        (変換後のLattice, 読み終わった後のperiod)を返す。
+        """
+        config = self.config
+        target_list, not_allow_list = self.compile_patterns(config)
+        if copy_on_write:
+            return_lattice = {speaker: dict(lattices)}
+        else:
+            return_lattice = {speaker: copy_links(lattices)}
+        ctx = ConversionContext(return_lattice, addwords, copy_on_write=copy_on_write, config=config)
+        ctx.speaker = speaker
+
+        starts = {k: float(v["start"]) for k, v in lattices.items()}
+        order = sorted(lattices, key=starts.__getitem__)
+        self.convert_words(ctx, [(k, lattices[k]["word"]) for k in order], target_list, not_allow_list, force_trans)
+        period = self.fused_post_process(ctx, speaker, starts, order, period=period)
+        return ctx.return_lattice[speaker], period
+
+    def execute_columns(self, columns, addwords, force_trans=False):
+        """LatticeColumns(src/lattice_columns.py)の漢数字をアラビア数字に変換したLatticeColumnsを返すメソッド。
+        リンクは開始時間順に並んでいるため並べ替えは行わず、単語の列だけを新しく作る(他の列は共有する)。
+        結果はexecute(fused=True)をLatticeColumns.to_dict()に対して行った場合と同じになる。
+        """
+        config = self.config
+        target_list, not_allow_list = self.compile_patterns(config)
+        speakers = {}
+        for speaker, speaker_columns in columns.speakers.items():
+            ctx = ColumnsContext(list(speaker_columns.words), addwords, config=config)
+            ctx.speaker = speaker
+            self.convert_words(ctx, list(enumerate(speaker_columns.words)), target_list, not_allow_list, force_trans)
+            self.fused_post_process(ctx, speaker, speaker_columns.starts, range(len(speaker_columns)))
+            speakers[speaker] = speaker_columns.replace_words(ctx.words)
+        return type(columns)(speakers)
+
+    def execute_parallel(self, lattice_obj, addwords, force_trans=False, workers=None, pool=None):
+        """話者ごとのLatticeをワーカープロセスのexecute_speaker()で並列に変換し、execute()と同じ形式のLatticeを返すメソッド。
+        話者同士は互いに影響しないため、結果はexecute()と同じになる。
+        poolにWorkerPoolを渡した場合はそのワーカープロセスを使い、渡さない場合はshared_pool()で
+        workers個(Noneの場合は話者数とCPU数の小さい方)のワーカープロセスを使い回す。
+        話者ごとのLatticeは呼び出しごとにワーカープロセスへ受け渡すため、小さいLatticeではexecute()より遅くなる。
+        (スレッドではGILのため速くならないので、プロセスでのみ並列化する)
+        """
+        if pool is None:
+            if workers is None:
+                workers = min(len(lattice_obj), os.cpu_count() or 1)
+            pool = shared_pool(self, workers)
+        futures = {speaker: pool.submit(_execute_speaker_worker, speaker, lattices, addwords, force_trans)
+                   for speaker, lattices in lattice_obj.items()}
+        # 話者の順番は引数のLatticeと同じにする
+        return {speaker: future.result()[0] for speaker, future in futures.items()}
+
+    def process_word(self, ctx, current_word, current_id):
+        """一時変数と現在の単語から、適切な単位で区切った上でアラビア変換するためのメソッド。
+        単語を１文字ずつdigit_action()の区切り規則で処理した場合と同じになるように、区切る位置は
+        コンパイル済みの遷移表から単語単位で求め、同じ単語の結果は使い回す。
+        """
+        state = (DIGIT_CLASSES.get(ctx.before_word2, DIGIT_OTHER_CLASS),
+                 DIGIT_CLASSES.get(ctx.before_word, DIGIT_OTHER_CLASS))
+        steps, state = compile_digit_word(current_word, state)
+        for step, value in steps:
+            if step == "flush":
+                self.update_return_lattice(ctx, remain2word=value)
+            else:
+                self.temp_value_add(ctx, current_word=value, update_lattice_ids=current_id)
 
-    def update_return_lattice(self, remain2word=False):
+    def update_return_lattice(self, ctx, remain2word=False):
         """Latticeの更新メソッド"""
-        if self.update_lattice_ids:
+        if ctx.update_lattice_ids:
             # 更新予定の先頭のLattice単語の情報を取得
-            first_id = self.update_lattice_ids[0]
-            first_lattice = self.return_lattice[self.speaker][first_id]
+            first_id = ctx.update_lattice_ids[0]
 
             # 更新予定の最後のLattice単語の情報を取得
-            # if len(self.update_lattice_ids) > 1:
+            # if len(ctx.update_lattice_ids) > 1:
             #     if remain2word:
-            #         last_id = self.update_lattice_ids[-2]
+            #         last_id = ctx.update_lattice_ids[-2]
             #     else:
-            #         last_id = self.update_lattice_ids[-1]
-            #     last_lattice = self.return_lattice[self.speaker][last_id]
+            #         last_id = ctx.update_lattice_ids[-1]
+            #     last_lattice = ctx.return_lattice[ctx.speaker][last_id]
             #     first_lattice["end"] = last_lattice["end"]
 
-            # 前回更新時の先頭IDが異なる場合は全IDの単語を!NULLにする
-            if self.before_first_id != first_id:
-                for i in self.update_lattice_ids:
-                    # del self.return_lattice[self.speaker][i]
-                    self.return_lattice[self.speaker][i]["word"] = "!NULL"
-            # 前回更新時の先頭IDが同じ場合は先頭ID以外の単語を!NULLにする
+            # 先頭ID以外の単語を!NULLにする
+            for i in ctx.update_lattice_ids[1:]:
+                # del ctx.return_lattice[ctx.speaker][i]
+                self.update_word(ctx, ctx.speaker, i, "!NULL")
+            # 前回更新時の先頭IDが異なる場合は先頭IDの単語も!NULLとして扱う
+            if ctx.before_first_id != first_id:
+                first_word = "!NULL"
             else:
-                for i in self.update_lattice_ids[1:]:
-                    # del self.return_lattice[self.speaker][i]
-                    self.return_lattice[self.speaker][i]["word"] = "!NULL"
+                first_word = ctx.get_word(ctx.speaker, first_id)
 
             # ２つ前の単語まで更新する場合はアラビア変換を行う文字列の末尾は除外
             if remain2word:
-                arabia_word = self.kansuji2arabic(self.new_word[:-1])
+                arabia_word = self.kansuji2arabic(ctx.new_word[:-1])
             # １つ前の単語まで更新する場合は全文字列でアラビア変換を行う
             else:
-                arabia_word = self.kansuji2arabic(self.new_word)
+                arabia_word = self.kansuji2arabic(ctx.new_word)
 
             # 更新しようとしているLatticeの単語が!NULLだった場合はアラビア数字で上書き
-            if self.return_lattice[self.speaker][first_id]["word"] == "!NULL":
-                if self.insert_space:
-                    first_lattice["word"] = " " + arabia_word
+            if first_word == "!NULL":
+                if ctx.insert_space:
+                    first_word = " " + arabia_word
                 else:
-                    first_lattice["word"] = arabia_word
+                    first_word = arabia_word
             # 更新しようとしているLatticeの単語が!NULL以外だった場合はアラビア数字を末尾に追加
             else:
-                first_lattice["word"] += " " + arabia_word
+                first_word += " " + arabia_word
 
             # Latticeを更新
-            self.return_lattice[self.speaker].update({first_id: first_lattice})
+            self.update_word(ctx, ctx.speaker, first_id, first_word)
             # 前回更新時の先頭IDを退避
-            self.before_first_id = first_id
+            ctx.before_first_id = first_id
 
         # 一時変数をクリア。２つ前の単語まで更新する場合は末尾１文字分の情報は残す
-        self.temp_value_clear(remain2word=remain2word)
-        self.insert_space = True
+        self.temp_value_clear(ctx, remain2word=remain2word)
+        ctx.insert_space = True
+
+    def update_word(self, ctx, speaker, word_id, word):
+        """Latticeの単語を更新するメソッド。単語が変わらない場合は何もしない"""
+        if ctx.get_word(speaker, word_id) == word:
+            return
+        ctx.set_word(speaker, word_id, word)
 
-    def temp_value_clear(self, remain2word=False):
+    def temp_value_clear(self, ctx, remain2word=False):
         """一時変数の値クリアメソッド"""
         # ２つ前の単語まで更新する場合は末尾１文字分の情報は残す
         if remain2word:
-            self.new_word = self.new_word[-1]
-            self.update_lattice_ids = self.update_lattice_ids[-1:]
-            self.before_word = self.new_word[-1]
-            self.before_word2 = ""
+            ctx.new_word = ctx.new_word[-1]
+            ctx.update_lattice_ids = ctx.update_lattice_ids[-1:]
+            ctx.before_word = ctx.new_word[-1]
+            ctx.before_word2 = ""
         else:
-            self.new_word = ""
-            self.update_lattice_ids = []
-            self.before_word = ""
-            self.before_word2 = ""
+            ctx.new_word = ""
+            ctx.update_lattice_ids = []
+            ctx.before_word = ""
+            ctx.before_word2 = ""
 
-    def temp_value_add(self, current_word="", update_lattice_ids=None):
-        """一時変数への値追加メソッド"""
+    def temp_value_add(self, ctx, current_word="", update_lattice_ids=None):
+        """一時変数への値追加メソッド。複数文字を渡した場合は１文字ずつ追加した場合と同じになる"""
         if update_lattice_ids is None:
             update_lattice_ids = []
 
-        self.new_word += current_word
+        ctx.new_word += current_word
 
         # 更新予定のIDが既に登録されていた場合は追加しない
-        if update_lattice_ids not in self.update_lattice_ids:
-            self.update_lattice_ids.append(update_lattice_ids)
+        if update_lattice_ids not in ctx.update_lattice_ids:
+            ctx.update_lattice_ids.append(update_lattice_ids)
 
-        self.before_word2 = self.before_word
-        self.before_word = current_word
+        if len(current_word) > 1:
+            ctx.before_word2 = current_word[-2]
+            ctx.before_word = current_word[-1]
+        else:
+            ctx.before_word2 = ctx.before_word
+            ctx.before_word = current_word
 
     def kansuji2arabic(self, word, sep=False):
         """渡された文字列をアラビア数字へ変換して返すメソッド。sep=Trueで３桁ごとにカンマを付ける。
         「十百千」のような文字列を渡すと「1110」になってしまうため、このメソッドに渡す文字列は
         単位を考慮し適切に加工する必要がある。
         """
-        # 数字系の文字を全て半角数字に変換
-        tt_ksuji = str.maketrans('一二三四五六七八九〇零１２３４５６７８９０',
-                                 '123456789001234567890')
-        transuji = word.translate(tt_ksuji)
-
-        re_suji = re.compile(r'[十百千\d]+')
-        # 連続した十百千または数字の中から文字数の長い順に処理
-        for suji in sorted(set(re_suji.findall(transuji)), key=lambda s: len(s), reverse=True):
-            # isdecimalはローマ数字または漢数字の場合にFalseになる。
-            # ちなみにisdigit()では漢数字の場合にFalseになる。
-            text = ''
-            if not suji.isdecimal():
-                for suji_div in re.findall(re_suji, suji):
-                    result = self.trans_value(suji_div)
-                    text += '{:,}'.format(result) if sep else str(result)
-            if text:
-                transuji = transuji.replace(suji, text)
-        return transuji
+        return NUMERAL_CACHE.get(("kansuji2arabic", word, sep), parse_kansuji, word, sep)
 
-    @staticmethod
-    def trans_value(sj):
-        """単位に合わせてアラビア数字に変換するメソッド"""
-        trans_unit = {'十': 10,
-                      '百': 100,
-                      '千': 1000}
-        unit = 1
-        result = 0
-        for piece in reversed(re.findall(r'[十百千]|\d+', sj)):
-            if piece in trans_unit:
-                if unit > 1:
-                    result += unit
-                unit = trans_unit[piece]
-            else:
-                # piece.isdecimal()がTrueになるのは全てアラビア数字の時。(半角全角問わず)
-                val = int(piece)
-                result += val * unit
-                unit = 1
-        if unit > 1:
-            result += unit
-        return result
-
-    def arabic2kansuji(self):
+    def arabic2kansuji(self, ctx):
         """アラビア数字から漢数字に戻すメソッド"""
 
         temp_lattice = {}
         # Latticeから!NULLと空白を除去して一時的なLatticeを作る
-        for speaker, lattices in self.return_lattice.items():
+        for speaker, lattices in ctx.return_lattice.items():
             temp_lattice.setdefault(speaker, {})
             for current_id, current_data in lattices.items():
                 if current_data["word"] not in ["!NULL", "!ENTER", "!EXIT"] and current_data["word"].replace(" ", "") != "":
                     temp_lattice[speaker].setdefault(current_id, current_data)
 
+        excluded_words = self.compile_exclusion(ctx.addwords, ctx.config)
+
         # 一時的なLatticeのID一覧を作成
-        for speaker, lattices in self.return_lattice.items():
+        for speaker, lattices in ctx.return_lattice.items():
             arabic2kansuji_ids = []
             arabic2kansuji_flag = False
 
@@ -393,7 +1003,7 @@ class Kansuji2Arabic(object):
                 if current_word in self.omit_list2:
                     # 退避したIDの単語を漢数字に戻す
                     if arabic2kansuji_ids:
-                        self.trans_omit(arabic2kansuji_ids, speaker)
+                        self.trans_omit(ctx, arabic2kansuji_ids, speaker)
                     arabic2kansuji_flag = False
                     arabic2kansuji_ids = []
                 else:
@@ -401,7 +1011,7 @@ class Kansuji2Arabic(object):
                     if current_word in self.omit_list1:
                         # 読み込んだ単語より前に既に 第 があった場合は退避したIDの単語を漢数字に戻す
                         if arabic2kansuji_flag and arabic2kansuji_ids:
-                            self.trans_omit(arabic2kansuji_ids, speaker)
+                            self.trans_omit(ctx, arabic2kansuji_ids, speaker)
                         arabic2kansuji_flag = True
                         arabic2kansuji_ids = []
                     # !NULLは一旦アラビア数字と同じ扱いにし、漢数字に戻す処理内で無視する。
@@ -414,7 +1024,7 @@ class Kansuji2Arabic(object):
                             # 単語内の文字のスペースを除去し、int型に変換できるかチェック
                             for x in current_word.split():
                                 int(x)
-                                if len(x) > 4 or x in self.setting['除外単語'] + self.addwords:
+                                if len(x) > 4 or x in excluded_words:
                                     # 4桁以上ならスキップ
                                     skip = True
                         # int型に変換できないならアラビア数字ではないと判断しスキップ
@@ -427,14 +1037,14 @@ class Kansuji2Arabic(object):
                             # スキップした場合
                             # 読み込んだ単語より前に 第 があった場合は退避したIDの単語を漢数字に戻す
                             if arabic2kansuji_flag and arabic2kansuji_ids:
-                                self.trans_omit(arabic2kansuji_ids, speaker)
+                                self.trans_omit(ctx, arabic2kansuji_ids, speaker)
                             arabic2kansuji_flag = False
                             arabic2kansuji_ids = []
             # 話者の単語を全て読み込んだ後、前に 第 がある、かつ退避したIDが残っている場合は漢数字に戻す
             if arabic2kansuji_flag and arabic2kansuji_ids:
-                self.trans_omit(arabic2kansuji_ids, speaker)
+                self.trans_omit(ctx, arabic2kansuji_ids, speaker)
 
-    def trans_omit(self, arabic2kansuji_ids, speaker):
+    def trans_omit(self, ctx, arabic2kansuji_ids, speaker):
         tt_ksuji = str.maketrans('1234567890', '一二三四五六七八九〇')
         tanni = {
             0: "",
@@ -446,7 +1056,7 @@ class Kansuji2Arabic(object):
         # 退避したIDの単語を順に読み込む
         for reverse_id in arabic2kansuji_ids:
             # 単語をスペースで区切る
-            words = self.return_lattice[speaker][reverse_id]["word"].split()
+            words = ctx.return_lattice[speaker][reverse_id]["word"].split()
             # 区切った結果の長さが0または!NULLだった場合はスキップ
             if len(words) == 0 or words in ["!NULL", "!ENTER", "!EXIT"]:
                 continue
@@ -476,294 +1086,400 @@ class Kansuji2Arabic(object):
                                 output = reverse_word + tanni[i] + output
                 temp += output
             # 漢数字に戻したら、Latticeを更新
-            self.return_lattice[speaker][reverse_id]["word"] = temp
+            self.update_word(ctx, speaker, reverse_id, temp)
 
-    def consecutive_number_edit(self):
+    @staticmethod
+    def _is_content_word(word):
+        """!NULL !ENTER !EXITと空白以外の単語ならTrueを返すメソッド"""
+        return word not in ["!NULL", "!ENTER", "!EXIT"] and word.replace(" ", "") != ""
+
+    def _content_tokens(self, ctx, speaker, reverse=False):
+        """Latticeから!NULLと空白を除去し、時間順に並べたIDと単語(スペース区切り)の一覧を返すメソッド"""
+        lattices = ctx.return_lattice[speaker]
+        ids = [k for k, v in sorted(lattices.items(), key=lambda x: float(x[1]["start"]), reverse=reverse)
+               if self._is_content_word(v["word"])]
+        return ids, [lattices[k]["word"].split() for k in ids]
+
+    def consecutive_number_edit(self, ctx):
         """２つ続いた１桁数字の間に「,」を入れるメソッド"""
-        tani = list(self.setting['単位'])
-        keys = {}
-        temp_lattice = {}
-        # Latticeから!NULLと空白を除去して一時的なLatticeを作る
-        for speaker, lattices in self.return_lattice.items():
-            temp_lattice.setdefault(speaker, {})
-            for current_id, current_data in lattices.items():
-                if current_data["word"] not in ["!NULL", "!ENTER", "!EXIT"] and current_data["word"].replace(" ", "") != "":
-                    temp_lattice[speaker].setdefault(current_id, current_data)
-
-        # 一時的なLatticeのID一覧を作成
-        for speaker in range(1, len(temp_lattice) + 1):
-            keys.setdefault(str(speaker), [k for k, v in sorted(
-                temp_lattice.get(
-                    str(speaker), {}).items(), key=lambda x: float(x[1]["start"]))])
-
         # 各話者ごとに一時的なLatticeを読み込む
-        for speaker, lattices in temp_lattice.items():
-            update_words = {}
-            period = False
-            # 一時的なLatticeの単語を順次読み込む
-            for i, (current_id, current_data) in enumerate(sorted(lattices.items(), key=lambda x: float(x[1]["start"]))):
-                current_words = current_data["word"].split()
-
-                temp = []
-                for j, current_word in enumerate(current_words):
-                    if len(current_word) > 1 or current_word == "0":
-                        temp.append(current_word)
-                        continue
-                    if current_word == ".":
-                        temp.append(current_word)
-                        period = True
-                        continue
+        for speaker in ctx.return_lattice:
+            ids, tokens = self._content_tokens(ctx, speaker)
+            update_words, period = self._consecutive_number_tokens(tokens, units=self.compile_units(ctx.config))
+            for update_id, temp in zip(ids, update_words):
+                self.update_word(ctx, speaker, update_id, " ".join(temp))
+
+    def _consecutive_number_tokens(self, tokens, period=False, units=None):
+        """consecutive_number_editの本体。時間順の単語一覧を受け取り、
+        (「，」を入れた単語一覧, 読み終わった後のperiod)を返す。
+        unitsは単位のUnitIndexで、省略した場合は現在の設定の単位を使う
+        """
+        if units is None:
+            units = self.compile_units()
+        update_words = []
+        # 一時的なLatticeの単語を順次読み込む
+        for i, current_words in enumerate(tokens):
+            temp = []
+            for j, current_word in enumerate(current_words):
+                if len(current_word) > 1 or current_word == "0":
+                    temp.append(current_word)
+                    continue
+                if current_word == ".":
+                    temp.append(current_word)
+                    period = True
+                    continue
 
-                    before_word2, before_word, next_word, next_word2 = self._get_before_next(
-                        keys, speaker, i, j, current_words, lattices)
+                before_word2, before_word, next_word, next_word2 = self._get_before_next(tokens, i, j)
 
-                    try:
-                        # １つ次の単語が数値かのチェック
-                        int(current_word)
-                        int(next_word)
-                    # 数値じゃないなら次の単語へ
-                    except ValueError:
-                        temp.append(current_word)
-                        if current_word != ".":
-                            period = False
-                        continue
-                    try:
-                        int(before_word)
-                    except ValueError:
-                        pass
-                    else:
+                try:
+                    # １つ次の単語が数値かのチェック
+                    int(current_word)
+                    int(next_word)
+                # 数値じゃないなら次の単語へ
+                except ValueError:
+                    temp.append(current_word)
+                    if current_word != ".":
+                        period = False
+                    continue
+                try:
+                    int(before_word)
+                except ValueError:
+                    pass
+                else:
+                    temp.append(current_word)
+                    continue
+                try:
+                    int(next_word2)
+                except ValueError:
+                    unit_flag = units.startswith_unit(next_word2)
+
+                    if (len(next_word) == 1
+                            and int(next_word) - int(current_word) == 1
+                            and not period and unit_flag):
                         temp.append(current_word)
+                        temp.append("，")
                         continue
-                    try:
-                        int(next_word2)
-                    except ValueError:
-                        unit_flag = False
-                        for unit in self.setting["単位"]:
-                            if next_word2[0: 1] == unit:
-                                unit_flag = True
-                                break
-                            continue
-
-                        if (len(next_word) == 1
-                                and int(next_word) - int(current_word) == 1
-                                and not period and unit_flag):
-                            temp.append(current_word)
-                            temp.append("，")
-                            continue
-                    temp.append(current_word)
-                update_words.setdefault(current_id, " ".join(temp))
-            for update_id, update_word in update_words.items():
-                self.return_lattice[speaker][update_id]["word"] = update_word
+                temp.append(current_word)
+            update_words.append(temp)
+        return update_words, period
 
-    def ten2period(self):
+    def ten2period(self, ctx):
         """可能であれば「点」「、」を小数点「.」に置き換えるメソッド"""
-        keys = {}
-        temp_lattice = {}
-        # Latticeから!NULLと空白を除去して一時的なLatticeを作る
-        for speaker, lattices in self.return_lattice.items():
-            temp_lattice.setdefault(speaker, {})
-            for current_id, current_data in lattices.items():
-                if current_data["word"] not in ["!NULL", "!ENTER", "!EXIT"] and current_data["word"].replace(" ", "") != "":
-                    temp_lattice[speaker].setdefault(current_id, current_data)
-
-        # 一時的なLatticeのID一覧を作成
-        for speaker in range(1, len(temp_lattice) + 1):
-            keys.setdefault(str(speaker), [k for k, v in sorted(
-                temp_lattice.get(
-                    str(speaker), {}).items(), key=lambda x: float(x[1]["start"]))])
-
         # 各話者ごとに一時的なLatticeを読み込む
-        for speaker, lattices in temp_lattice.items():
-            # 一時的なLatticeの単語を順次読み込む
-            for i, (current_id, current_data) in enumerate(sorted(lattices.items(), key=lambda x: float(x[1]["start"]))):
-                current_words = current_data["word"].split()
-
-                temp = []
-                for j, current_word in enumerate(current_words):
-                    if current_word not in ["、", "点"]:
-                        temp.append(current_word)
-                        continue
+        for speaker in ctx.return_lattice:
+            ids, tokens = self._content_tokens(ctx, speaker)
+            self._ten2period_tokens(tokens)
+            for current_id, temp in zip(ids, tokens):
+                self.update_word(ctx, speaker, current_id, " ".join(temp))
+
+    def _ten2period_tokens(self, tokens):
+        """ten2periodの本体。時間順の単語一覧を先頭から順に書き換える"""
+        # 一時的なLatticeの単語を順次読み込む
+        for i, current_words in enumerate(tokens):
+            temp = []
+            for j, current_word in enumerate(current_words):
+                if current_word not in ["、", "点"]:
+                    temp.append(current_word)
+                    continue
 
-                    before_word2, before_word, next_word, next_word2 = self._get_before_next(
-                        keys, speaker, i, j, current_words, lattices)
+                before_word2, before_word, next_word, next_word2 = self._get_before_next(tokens, i, j)
 
-                    try:
-                        # １つ前の単語が数値かのチェック
-                        int(before_word)
-                        # １つ次の単語が数値かのチェック
-                        int(next_word)
-                    # 数値じゃないなら次の単語へ
-                    except ValueError:
-                        temp.append(current_word)
-                        continue
+                try:
+                    # １つ前の単語が数値かのチェック
+                    int(before_word)
+                    # １つ次の単語が数値かのチェック
+                    int(next_word)
+                # 数値じゃないなら次の単語へ
+                except ValueError:
+                    temp.append(current_word)
+                    continue
+                else:
+                    # ２つ前の単語と２つ次の単語が 点 、 ではない かつ
+                    # １つ次の単語が１桁の数値の場合は 点 、 を . に置換
+                    if (
+                        before_word2 not in ["、", "点", "."] and
+                        # len(before_word) <= 3 and
+                        len(next_word) == 1
+                        and next_word2 not in ["、", "点", "."]
+                    ):
+                        temp.append(".")
                     else:
-                        # ２つ前の単語と２つ次の単語が 点 、 ではない かつ
-                        # １つ次の単語が１桁の数値の場合は 点 、 を . に置換
-                        if (
-                            before_word2 not in ["、", "点", "."] and
-                            # len(before_word) <= 3 and
-                            len(next_word) == 1
-                            and next_word2 not in ["、", "点", "."]
-                        ):
-                            temp.append(". ")
-                        else:
-                            temp.append(current_word)
-                self.return_lattice[speaker][current_id]["word"] = " ".join(temp)
+                        temp.append(current_word)
+            # 後続の単語からは置換後の単語を参照する
+            tokens[i] = temp
 
     @staticmethod
-    def _get_before_next(keys, speaker, index, index2, current_words, lattices):
+    def _get_before_next(tokens, index, index2):
+        """時間順の単語一覧から、index番目の単語のindex2番目の前後２つずつの単語を返すメソッド"""
+        # 存在しない単語は!NULLとして扱う
+        null_words = ["!NULL"]
         # ２つ前の単語を参照
-        before_key2 = keys[speaker][index - 2] if index - 2 >= 0 else ""
+        before_words2 = tokens[index - 2] if index - 2 >= 0 else null_words
         # １つ前の単語を参照
-        before_key = keys[speaker][index - 1] if index - 1 >= 0 else ""
+        before_words = tokens[index - 1] if index - 1 >= 0 else null_words
         # １つ次の単語を参照
-        next_key = keys[speaker][index + 1] if index + 1 <= len(keys[speaker]) - 1 else ""
+        next_words = tokens[index + 1] if index + 1 <= len(tokens) - 1 else null_words
         # ２つ次の単語を参照
-        next_key2 = keys[speaker][index + 2] if index + 2 <= len(keys[speaker]) - 1 else ""
+        next_words2 = tokens[index + 2] if index + 2 <= len(tokens) - 1 else null_words
 
         before_word2 = "!NULL"
         before_word = "!NULL"
         next_word = "!NULL"
         next_word2 = "!NULL"
 
+        current_words = tokens[index]
         current_words_len = len(current_words)
+        before_words_len = len(before_words) if index - 1 >= 0 else 0
+        next_words_len = len(next_words) if index + 1 <= len(tokens) - 1 else 0
 
         if index2 == 0:
-            if len(lattices.get(before_key, {"word": ""})["word"].split()) == 1:
-                before_word2 = lattices.get(before_key2, {"word": "!NULL"})["word"].split()[-1]
-                before_word = lattices.get(before_key, {"word": "!NULL"})["word"].split()[0]
-            elif len(lattices.get(before_key, {"word": ""})["word"].split()) >= 2:
-                before_word2 = lattices.get(before_key, {"word": "!NULL"})["word"].split()[-2]
-                before_word = lattices.get(before_key, {"word": "!NULL"})["word"].split()[-1]
+            if before_words_len == 1:
+                before_word2 = before_words2[-1]
+                before_word = before_words[0]
+            elif before_words_len >= 2:
+                before_word2 = before_words[-2]
+                before_word = before_words[-1]
         elif index2 == 1:
-            before_word2 = lattices.get(before_key, {"word": "!NULL"})["word"].split()[-1]
+            before_word2 = before_words[-1]
             before_word = current_words[index2 - 1]
         elif index2 >= 2:
             before_word2 = current_words[index2 - 2]
             before_word = current_words[index2 - 1]
 
         if index2 == (current_words_len - 1):
-            if len(lattices.get(next_key, {"word": ""})["word"].split()) == 1:
-                next_word = lattices.get(next_key, {"word": "!NULL"})["word"].split()[0]
-                next_word2 = lattices.get(next_key2, {"word": "!NULL"})["word"].split()[0]
-            elif len(lattices.get(next_key, {"word": ""})["word"].split()) >= 2:
-                next_word = lattices.get(next_key, {"word": "!NULL"})["word"].split()[0]
-                next_word2 = lattices.get(next_key, {"word": "!NULL"})["word"].split()[1]
+            if next_words_len == 1:
+                next_word = next_words[0]
+                next_word2 = next_words2[0]
+            elif next_words_len >= 2:
+                next_word = next_words[0]
+                next_word2 = next_words[1]
         elif index2 == (current_words_len - 2):
             next_word = current_words[index2 + 1]
-            next_word2 = lattices.get(next_key, {"word": "!NULL"})["word"].split()[0]
+            next_word2 = next_words[0]
         elif index2 <= (current_words_len - 3):
             next_word = current_words[index2 + 1]
             next_word2 = current_words[index2 + 2]
 
         return before_word2, before_word, next_word, next_word2
 
-    def lattice_one_subst(self):
+    def lattice_one_subst(self, ctx):
         # 各話者ごとに一時的なLatticeを読み込む
-        for speaker, lattices in self.return_lattice.items():
-            update_id = []
-            break_word = False
-            for current_id, current_data in sorted(lattices.items(),
-                                                   key=lambda x: float(x[1]["start"])):
-                for i, word in enumerate(current_data["word"].split()):
-                    if word in ["!NULL", "!ENTER", "!EXIT"]:
-                        # 2秒未満の!NULL !ENTER !EXITは無視するようにしていたが、時間に関わらず無視してよい
-                        # とのことで修正
-                        # word_time_length = float(current_data["end"]) - float(current_data["start"])
-                        # if word_time_length >= 2:
-                        #     break_word = True
-                        break
-
-                    if len(word) != 1:
-                        break_word = True
-                        break
-                    try:
-                        int(word)
-                    except ValueError:
-                        break_word = True
-                        break
-                if (not break_word and current_id not in update_id
-                        and current_data["word"] not in ["!NULL", "!ENTER", "!EXIT"]
-                        and current_data["word"].replace(" ", "") != ""):
-                    update_id.append(current_id)
-                if break_word:
-                    temp = ""
-                    for word_id in update_id:
-                        temp += lattices[word_id]["word"] + " "
-                    for i, word_id in enumerate(update_id):
-                        if i == 0:
-                            self.return_lattice[speaker][word_id]["word"] = temp
-                        else:
-                            self.return_lattice[speaker][word_id]["word"] = "!NULL"
-                    update_id = []
-                    break_word = False
-            if update_id:
-                temp = ""
-                for word_id in update_id:
-                    temp += lattices[word_id]["word"] + " "
-                for i, word_id in enumerate(update_id):
-                    if i == 0:
-                        self.return_lattice[speaker][word_id]["word"] = temp
-                    else:
-                        self.return_lattice[speaker][word_id]["word"] = "!NULL"
+        for speaker, lattices in ctx.return_lattice.items():
+            order = [k for k, v in sorted(lattices.items(), key=lambda x: float(x[1]["start"]))]
+            words = {k: lattices[k]["word"] for k in order}
+            self._one_subst_words(order, words)
+            for word_id in order:
+                self.update_word(ctx, speaker, word_id, words[word_id])
 
-    def lattice_space_edit(self):
-        temp_lattice = {}
-        # Latticeから!NULLと空白を除去して一時的なLatticeを作る
-        for speaker, lattices in self.return_lattice.items():
-            temp_lattice.setdefault(speaker, {})
-            for current_id, current_data in lattices.items():
-                if current_data["word"] not in ["!NULL", "!ENTER", "!EXIT"] and current_data["word"].replace(" ", "") != "":
-                    temp_lattice[speaker].setdefault(current_id, current_data)
+    @staticmethod
+    def _one_subst_words(order, words, tokens=None):
+        """lattice_one_substの本体。時間順のID一覧と単語の辞書を受け取り、単語の辞書を書き換える。
+        tokensに分割済みの単語の辞書を渡した場合は再分割せず、まとめた単語の分割結果もtokensに書き込む
+        """
+        update_id = []
+        break_word = False
+        for current_id in order:
+            current_word = words[current_id]
+            current_words = None if tokens is None else tokens.get(current_id)
+            if current_words is None:
+                current_words = current_word.split()
+            for i, word in enumerate(current_words):
+                if word in ["!NULL", "!ENTER", "!EXIT"]:
+                    # 2秒未満の!NULL !ENTER !EXITは無視するようにしていたが、時間に関わらず無視してよい
+                    # とのことで修正
+                    break
+
+                if len(word) != 1:
+                    break_word = True
+                    break
+                try:
+                    int(word)
+                except ValueError:
+                    break_word = True
+                    break
+            if (not break_word
+                    and current_word not in ["!NULL", "!ENTER", "!EXIT"]
+                    and current_word.replace(" ", "") != ""):
+                update_id.append(current_id)
+            if break_word:
+                Kansuji2Arabic._one_subst_join(update_id, words, tokens)
+                update_id = []
+                break_word = False
+        if update_id:
+            Kansuji2Arabic._one_subst_join(update_id, words, tokens)
 
-        # 各話者ごとに一時的なLatticeを読み込む
-        for speaker, lattices in temp_lattice.items():
-            next_len = 0
-            next2period = False
-            insert_space = False
-            count = 0
-            # 一時的なLatticeの単語を順次読み込む
-            for current_id, current_data in sorted(lattices.items(),
-                                                   key=lambda x: float(x[1]["start"]),
-                                                   reverse=True):
-                temp = ""
-                # 単語を後ろから読み込む
-                for word in reversed(current_data["word"].split()):
-                    if word == ".":
-                        next_len = 0
-                        insert_space = False
-                        next2period = True
-                        count = 1
-                        temp = word + temp
-                        continue
-                    try:
-                        # 単語内の文字のスペースを除去し、int型に変換できるかチェック
-                        int(word)
-                    except ValueError:
-                        next_len = 0
-                        insert_space = False
+    @staticmethod
+    def _one_subst_join(update_id, words, tokens=None):
+        """連続する一桁の数字を先頭のIDにまとめ、残りのIDは!NULLにするメソッド。
+        tokensに分割済みの単語の辞書を渡した場合は、まとめた単語の分割結果も書き込む
+        """
+        if tokens is not None and update_id:
+            tokens[update_id[0]] = [token for word_id in update_id
+                                    for token in tokens.get(word_id) or words[word_id].split()]
+        temp = ""
+        for word_id in update_id:
+            temp += words[word_id] + " "
+        for i, word_id in enumerate(update_id):
+            if i == 0:
+                words[word_id] = temp
+            else:
+                words[word_id] = "!NULL"
+
+    def lattice_space_edit(self, ctx):
+        # 各話者ごとに一時的なLatticeを読み込む(時間の逆順)
+        for speaker in ctx.return_lattice:
+            ids, tokens = self._content_tokens(ctx, speaker, reverse=True)
+            for current_id, temp in zip(ids, self._space_edit_tokens(tokens)):
+                # Latticeを更新
+                if temp:
+                    self.update_word(ctx, speaker, current_id, temp)
+
+    @staticmethod
+    def _space_edit_tokens(tokens):
+        """lattice_space_editの本体。時間の逆順の単語一覧を受け取り、スペースを入れ直した単語を返す"""
+        update_words = []
+        next_len = 0
+        next2period = False
+        insert_space = False
+        count = 0
+        # 一時的なLatticeの単語を順次読み込む
+        for current_words in tokens:
+            temp = ""
+            # 単語を後ろから読み込む
+            for word in reversed(current_words):
+                if word == ".":
+                    next_len = 0
+                    insert_space = False
+                    next2period = True
+                    count = 1
+                    temp = word + temp
+                    continue
+                try:
+                    # 単語内の文字のスペースを除去し、int型に変換できるかチェック
+                    int(word)
+                except ValueError:
+                    next_len = 0
+                    insert_space = False
+                    next2period = False
+                    count = 0
+                    temp = word + temp
+                    continue
+                # 一桁の数値が連続していたらスペースは入れない
+                if len(word) == 1 and next_len == 1 or not insert_space:
+                    if next2period and count == 2:
+                        temp = word + " " + temp
                         next2period = False
                         count = 0
-                        temp = word + temp
-                        continue
-                    # 一桁の数値が連続していたらスペースは入れない
-                    if len(word) == 1 and next_len == 1 or not insert_space:
-                        if next2period and count == 2:
-                            temp = word + " " + temp
-                            next2period = False
-                            count = 0
-                        else:
-                            temp = word + temp
-                    # 間にスペースを入れて連結
                     else:
-                        temp = word + " " + temp
-                    next_len = len(word)
-                    insert_space = True
-                    if next2period:
-                        count += 1
-                # Latticeを更新
-                if temp:
-                    self.return_lattice[speaker][current_id]["word"] = temp
+                        temp = word + temp
+                # 間にスペースを入れて連結
+                else:
+                    temp = word + " " + temp
+                next_len = len(word)
+                insert_space = True
+                if next2period:
+                    count += 1
+            update_words.append(temp)
+        return update_words
+
+    def fused_post_process(self, ctx, speaker, starts, order, period=False):
+        """ten2period、consecutive_number_edit、lattice_one_subst、lattice_space_editを
+        話者ごとに１回だけ作った時間順の単語列に対してまとめて適用するメソッド。
+        各メソッドを順に呼んだ場合と同じ結果になる。periodはconsecutive_number_editの初期状態で、
+        読み終わった後の状態を返す。
+        """
+        words = {k: ctx.get_word(speaker, k) for k in order}
+
+        # !NULLと空白を除去した単語列を作る(以降の処理ではこの分割結果を使い回す)
+        ids = [k for k in order if self._is_content_word(words[k])]
+        tokens = [words[k].split() for k in ids]
+
+        # 可能であれば「点」「、」を小数点にする(単語ごとの数は変わらない)
+        self._ten2period_tokens(tokens)
+
+        # 一桁が２回続いた場合は「，」を間に入れる
+        tokens, period = self._consecutive_number_tokens(tokens, period, units=self.compile_units(ctx.config))
+        for current_id, temp in zip(ids, tokens):
+            words[current_id] = " ".join(temp)
+
+        # 連続する一桁の数字は１つにまとめる(まとめた単語の分割結果もtokensに反映する)
+        tokens = dict(zip(ids, tokens))
+        self._one_subst_words(order, words, tokens)
+
+        # 半角スペースを適切な位置に入れる(時間の逆順。同じ開始時間の単語はlattice_space_editと同じく元の順)
+        ids = [k for k in self._reverse_order(order, starts) if self._is_content_word(words[k])]
+        for current_id, temp in zip(ids, self._space_edit_tokens([tokens[k] for k in ids])):
+            if temp:
+                words[current_id] = temp
+
+        # 変更があった単語のみLatticeを更新
+        for current_id in order:
+            self.update_word(ctx, speaker, current_id, words[current_id])
+        return period
+
+    @staticmethod
+    def _reverse_order(order, starts):
+        """時間順のID一覧を時間の逆順にして返すメソッド。
+        sorted(reverse=True)と同じく、同じ開始時間のIDは元の順のままにする
+        """
+        reverse_order = []
+        end = len(order)
+        while end > 0:
+            begin = end - 1
+            start = starts[order[begin]]
+            while begin > 0 and starts[order[begin - 1]] == start:
+                begin -= 1
+            reverse_order.extend(order[begin:end])
+            end = begin
+        return reverse_order
+
+    def execute_item(self, item, addwords, force_trans=False, **options):
+        """Latticeか、tr_edit_lattice()に通すjsonファイルのパスを受け取り、execute()の結果を返すメソッド"""
+        if isinstance(item, (str, os.PathLike)):
+            item, keywords = self.load_lattice_file(item)
+        return self.execute(item, addwords, force_trans=force_trans, **options)
+
+    def execute_many(self, items, addwords=None, force_trans=False, workers=None, max_pending=None,
+                     return_exceptions=False, pool=None, **options):
+        """Latticeか、tr_edit_lattice()に通すjsonファイルのパスを複数受け取り、
+        ワーカープロセスでexecute()した結果を入力順に返すジェネレータ。
+        各ワーカープロセスはこのインスタンスの設定で変換クラスを１回だけ作って使い回す。
+        workersはワーカープロセス数(Noneの場合はCPU数、1以下の場合はこのプロセスで順に変換)、
+        max_pendingは同時に処理待ちにする件数(Noneの場合はworkersの4倍)。
+        poolにWorkerPoolを渡した場合は、新しくプロセスを起動せずにそのワーカープロセスで変換する(workersは無視する)。
+        return_exceptions=Trueの場合は変換に失敗した件は例外を結果として返し、処理を続ける。
+        optionsはexecute()にそのまま渡す。
+        """
+        if addwords is None:
+            addwords = []
+        if workers is None:
+            workers = os.cpu_count() or 1
+        func = functools.partial(Kansuji2Arabic.execute_item, addwords=addwords, force_trans=force_trans, **options)
+
+        if pool is not None:
+            yield from pool.map(func, items, max_pending=max_pending, return_exceptions=return_exceptions)
+            return
+
+        if workers <= 1:
+            for item in items:
+                try:
+                    result = self.execute_item(item, addwords, force_trans=force_trans, **options)
+                except Exception as err:
+                    if not return_exceptions:
+                        raise
+                    result = err
+                yield result
+            return
+
+        with WorkerPool(self, workers) as pool:
+            yield from pool.map(func, items, max_pending=max_pending, return_exceptions=return_exceptions)
+
+    @staticmethod
+    def load_lattice_file(path):
+        """jsonファイルを読み込み、tr_edit_lattice()の結果を返すメソッド"""
+        with open(path, mode="r", encoding="utf-8") as f:
+            json_data = json.load(f)
+        return Kansuji2Arabic.tr_edit_lattice(json_data)
 
     # TRのLattice編集メソッド
     @staticmethod
@@ -819,83 +1535,203 @@ class Kansuji2Arabic(object):
                 return_random_lattice[str(sp)].update({str(word_index): tmp})
         return return_random_lattice
 
-    # パフォーマンス測定用メソッド
-    @document_it
-    def loop_arabia(self, lattice=None):
-        for i in range(1000):
-            if not lattice:
-                self.execute(self.random_lattice(), [], force_trans=True)
-            else:
-                self.execute(lattice, [], force_trans=True)
-
-
-if __name__ == "__main__":
-    trans = Kansuji2Arabic()
-
-    test_lattice = trans.random_lattice()
-    trans.loop_arabia(test_lattice)
-    exit(0)
-
-    test_lattice = trans.random_lattice()
-
-    for sp, word_indexes in test_lattice.items():
-        for word_index, data in word_indexes.items():
-            print(sp, word_index, data)
-
-    # print(trans.kansuji2arabic("月払いで２億一万二千と百と三百四十五円お支払い"))
-
-    print("-" * 15)
-    import json
-    import requests
-    addwords = {"words_to_check": []}
-    # text = '0123456789０１２３４５６７８９一二三四五六七八九〇零十百千万億兆点、章段第'
-    text = '０１２３４５６７８９'
-    for x in range(len(text)):
-        for y in range(len(text)):
-            for z in range(len(text)):
-                addwords["words_to_check"].append(text[x])
-                addwords["words_to_check"].append(text[y])
-                addwords["words_to_check"].append(text[z])
-                addwords["words_to_check"].append(text[x] + text[y])
-                addwords["words_to_check"].append(text[x] + text[z])
-                addwords["words_to_check"].append(text[y] + text[z])
-                addwords["words_to_check"].append(text[x] + text[y] + text[z])
-    addwords["words_to_check"] = list(set(addwords["words_to_check"]))
-    print(len(addwords["words_to_check"]))
-
-    addwords["words_to_check"] = ["九十九"]
-
-    # ['0', '1', '10', '100', '10０', '1０', '1０0', '1００', '2', '3', '4', '5', '6', '7', '8', '9',
-    # '、', '〇', '〇〇', '一', '一九', '一兆', '一段', '七', '万', '万一', '万万', '万八', '万六', '万十',
-    # '三', '三八', '三六', '九', '九段', '二', '二十', '二十二', '五', '億', '億万', '兆', '八', '八十八',
-    # '六', '十', '十一', '千', '四', '四万十', '四十万', '段', '点', '点点', '百', '章', '章一', '章三',
-    # '章二', '第', '第一', '第九', '第二', '０', '１', '１0', '１00', '１0０', '１０', '１０0', '１００',
-    # '２', '３', '４', '５', '６', '７', '８', '９']
-    result_list = []
-    temp = []
-    result = {}
-    count = 0
-    for i, x in enumerate(addwords["words_to_check"]):
-        temp.append(x)
-        if not (i+1) % 5000:
-            print(i+1, "/", len(addwords["words_to_check"]), len(temp), "個問い合わせ")
-            result = requests.post(url="http://192.168.13.18:19901" + "/checkwords",
-                                   json={"words_to_check": temp}).json()
-            for y in temp:
-                if result[y]["exists"] is True:
-                    result_list.append(y)
-            temp = []
-        count += 1
-    if temp:
-        print(count, "/", len(addwords["words_to_check"]), len(temp), "個問い合わせ")
-        result = requests.post(url="http://192.168.13.18:19901" + "/checkwords",
-                               json={"words_to_check": temp}).json()
-        for y in temp:
-            if result[y]["exists"] is True:
-                result_list.append(y)
-    print(sorted(list(set(result_list))))
-
-    # print(json.dumps(result,
-    #                  indent=4,
-    #                  ensure_ascii=False)
-    #       )
+
+class StreamingKansuji2Arabic(object):
+    """音声認識結果を逐次変換するクラス。
+    話者ごとにリンクを時間順にpush()すると、漢数字や数値を含まない単語(区切りの単語)が届いた時点で
+    それまでのリンクの変換結果を確定して返す。区切りの単語の前後で後処理の結果は互いに影響しないため、
+    確定した結果はKansuji2Arabic.execute()でまとめて変換した場合と同じになる。
+    !NULL !ENTER !EXITはexecute()と同様に無視するため、区切りにはならない。
+    「万」「が」「一」のように複数のリンクにまたがる除外単語の途中に現れる単語も区切りにしない。
+    (除外単語の先頭の単語は次の区間の前の文脈として残すため、区切りにしてよい)
+    区切りの単語が来ないまま未確定のリンクがmax_pending件に達した場合は、その時点で確定する
+    (この場合のみ、まとめて変換した場合と結果が変わることがある)。
+    """
+    def __init__(self, trans=None, addwords=None, force_trans=False, max_pending=1000):
+        self.trans = trans if trans is not None else Kansuji2Arabic()
+        self.addwords = addwords if addwords is not None else []
+        self.force_trans = force_trans
+        self.max_pending = max_pending
+
+        # 話者ごとの未確定のリンク [(ID, リンク)]
+        self.pending = {}
+        # 話者ごとの直前の区切りの単語 [(ID, リンク)]。次の区間の変換時に前の文脈として使う
+        self.context = {}
+        # 話者ごとのconsecutive_number_edit()の状態
+        self.period = {}
+
+    def push(self, speaker, link_id, link):
+        """リンクを１つ追加し、確定したリンクを[(ID, 変換後のリンク)]で返すメソッド"""
+        pending = self.pending.setdefault(speaker, [])
+        pending.append((link_id, link))
+        if self.is_barrier(link["word"]):
+            return self._convert(speaker, barrier=True)
+        if len(pending) >= self.max_pending:
+            return self._convert(speaker, barrier=False)
+        return []
+
+    def flush(self, speaker=None):
+        """未確定のリンクを全て確定して返すメソッド。
+        speakerを省略した場合は全話者分を{話者: [(ID, 変換後のリンク)]}で返す
+        """
+        if speaker is not None:
+            result = self._convert(speaker, barrier=False)
+            self.context.pop(speaker, None)
+            self.period.pop(speaker, None)
+            return result
+        speakers = list(self.pending) + [x for x in self.context if x not in self.pending]
+        return {speaker: self.flush(speaker) for speaker in speakers}
+
+    def is_barrier(self, word):
+        """前後の単語の変換結果に影響しない単語(漢数字、数値、点、「、」、「.」を含まず、
+        複数のリンクにまたがる除外単語の途中にも現れない単語)ならTrueを返すメソッド"""
+        if not Kansuji2Arabic._is_content_word(word) or KANSUJI_TARGET.search(word):
+            return False
+        if self.trans.compile_exclusion(self.addwords).inside(word):
+            return False
+        for token in word.split():
+            if token in ["、", "点", "."]:
+                return False
+            try:
+                int(token)
+            except ValueError:
+                continue
+            return False
+        return True
+
+    def _convert(self, speaker, barrier):
+        """未確定のリンクを変換して返すメソッド"""
+        pending = self.pending.pop(speaker, [])
+        if not pending:
+            return []
+        context = self.context.get(speaker, [])
+        links = context + pending
+
+        # 呼び出し元のIDが重複しても良いように、連番のIDで変換する
+        lattices = {i: link for i, (link_id, link) in enumerate(links)}
+        converted, self.period[speaker] = self.trans.execute_speaker(
+            speaker, lattices, self.addwords, force_trans=self.force_trans,
+            period=self.period.get(speaker, False))
+
+        self.context[speaker] = pending[-1:] if barrier else []
+        return [(link_id, converted[i]) for i, (link_id, link) in enumerate(links) if i >= len(context)]
+
+
+# WorkerPoolのワーカープロセスで使う変換クラス
+_worker_trans = None
+
+
+def _init_worker(trans_class, setting, config_path):
+    """WorkerPoolのワーカープロセスの初期化関数。config_pathがある場合は設定ファイルを読み込み、
+    ファイルが更新されると読み込み直す変換クラスを作る"""
+    global _worker_trans
+    if config_path is None:
+        _worker_trans = trans_class(setting=setting)
+    else:
+        _worker_trans = trans_class(config_path=config_path)
+
+
+def _call_worker(func, args, kwargs):
+    """ワーカープロセスでfunc(変換クラス, *args, **kwargs)を実行する関数"""
+    return func(_worker_trans, *args, **kwargs)
+
+
+class WorkerPool(object):
+    """ワーカープロセスごとに変換クラスを１回だけ作って使い回すプロセスプール。
+    submit()、map()に渡す関数は第１引数にワーカープロセスの変換クラスを受け取る。
+    ワーカープロセスに送るため、モジュールの関数か変換クラスのメソッド(またはそのfunctools.partial)にすること。
+    follow_config=Trueの場合、transが設定ファイルを読み込んでいればワーカーも同じファイルを読み込み、
+    ファイルが更新されると読み込み直す(それ以外の場合はtransの現在の設定を使い続ける)。
+    """
+    def __init__(self, trans, workers, follow_config=False):
+        self.workers = workers
+        # ワーカープロセスに渡した設定の版
+        self.version = trans.config.version
+        config_path = trans.config_path if follow_config else None
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                               initializer=_init_worker,
+                                                               initargs=(type(trans), trans.setting, config_path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def submit(self, func, *args, **kwargs):
+        """ワーカープロセスでfunc(変換クラス, *args, **kwargs)を実行し、結果を受け取るFutureを返すメソッド"""
+        return self.executor.submit(_call_worker, func, args, kwargs)
+
+    def start(self):
+        """ワーカープロセスを起動しておくメソッド(最初のsubmit()でも起動する)"""
+        self.executor.submit(int).result()
+
+    def map(self, func, items, max_pending=None, return_exceptions=False):
+        """itemsの各要素をワーカープロセスのfunc(変換クラス, 要素)で処理し、結果を入力順に返すジェネレータ。
+        max_pendingは同時に処理待ちにする件数(Noneの場合はworkersの4倍)で、それ以上は先に読み込まない。
+        return_exceptions=Trueの場合は失敗した要素は例外を結果として返し、処理を続ける。
+        """
+        if max_pending is None:
+            max_pending = self.workers * 4
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append(self.submit(func, item))
+                # 処理待ちが上限に達したら先頭の結果を待つ
+                if len(pending) >= max_pending:
+                    yield self._pop_result(pending, return_exceptions)
+            while pending:
+                yield self._pop_result(pending, return_exceptions)
+        finally:
+            # 途中で終了した場合は残りを取り消す
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _pop_result(pending, return_exceptions):
+        """処理待ちの先頭の結果を返すメソッド"""
+        future = pending.popleft()
+        try:
+            return future.result()
+        except Exception as err:
+            if not return_exceptions:
+                raise
+            return err
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+# shared_pool()で使い回すWorkerPool。{(変換クラス, ワーカー数): WorkerPool}
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def shared_pool(trans, workers):
+    """transと同じ設定のworkers個のワーカープロセスのWorkerPoolを返す関数。
+    同じ変換クラス・ワーカー数では同じWorkerPoolを使い回し、transの設定の版が変わった場合は作り直す。
+    使い回すWorkerPoolはインタプリタの終了時に終了する。
+    """
+    key = (type(trans), workers)
+    version = trans.config.version
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is not None and pool.version != version:
+            pool.shutdown(wait=False)
+            pool = None
+        if pool is None:
+            pool = _shared_pools[key] = WorkerPool(trans, workers)
+        return pool
+
+
+@atexit.register
+def _shutdown_shared_pools():
+    with _shared_pools_lock:
+        for pool in _shared_pools.values():
+            pool.shutdown()
+        _shared_pools.clear()
+
+
+def _execute_speaker_worker(trans, speaker, lattices, addwords, force_trans):
+    """execute_parallel()のワーカープロセスで１話者分を変換する関数"""
+    return trans.execute_speaker(speaker, lattices, addwords, force_trans=force_trans)
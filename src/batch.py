@@ -0,0 +1,482 @@
+# coding: utf-8
+"""フォルダ内の音声認識結果(jsonファイル)をまとめてアラビア変換するモジュール。
+
+main.pyのフォルダ読込から画面(wx)に関係しない処理を取り出したもの。
+"""
+import os
+import re
+import json
+import heapq
+import codecs
+import hashlib
+import operator
+import sys
+import tempfile
+import functools
+import collections
+
+from src import lattice_io
+from src import lattice_columns
+from src import arabic_original
+
+
+# result.csvに出力する行かどうかの判定に使う文字(内容に数字を含む行を出力する)
+NUMBER_PATTERN = re.compile('[一二三四五六七八九〇零十百千\\d点、.]')
+
+# lattice2csv()の見出し
+CSV_HEADER = "開始時間,話者,内容"
+
+# lattice2csv()に出力しない単語
+CSV_IGNORE_WORDS = frozenset([
+    "!NULL", "!ENTER", "!EXIT",
+    "はい", "はいはい", "あー", "あぁ",
+    # "。", "、",
+])
+
+# 読み込むファイルの拡張子
+INPUT_EXTENSIONS = (".txt", ".json")
+
+# result.csvの書き込みバッファのサイズ
+RESULT_BUFFER_SIZE = 1 << 20
+
+# ResultWriterがメモリに持つ行数の上限(超えた分は一時ファイルに書き出す)
+RESULT_MAX_BUFFER = 100000
+
+# 変換済みのファイルを記録するファイルの名前(出力フォルダに作る)
+MANIFEST_NAME = "manifest.jsonl"
+
+# NDJSONの出力をまとめて書き込む行数
+NDJSON_FLUSH_LINES = 1000
+
+# 変換の種類。(ファイル名の末尾, result.csvのタグ, force_trans)。force_transがNoneの場合は変換しない
+VARIANTS = (
+    ("", "4.アラビア変換無し", None),
+    ("(arabia1)", "1.アラビア変換－１", False),
+    # ("(arabia2)", "2.アラビア変換－２", False),
+    ("(force_arabia)", "3.強制アラビア変換", True),
+)
+
+
+def iter_csv_rows(lattice):
+    """lattice2csv()の見出し以外の行を順に返すジェネレータ。latticeは辞書形式かLatticeColumns。
+    リンクを開始時間順に並べ、同じ話者が続く単語は１行(内容の「"」の中)にまとめる。
+    """
+    if isinstance(lattice, lattice_columns.LatticeColumns):
+        all_links = lattice.iter_links()
+    else:
+        all_links = (link for links in lattice.values() for link in links.values())
+    links = sorted((link["start"], link["best_path"], link.get("speaker", "1"), link["word"]) for link in all_links)
+
+    # 出力中の行の(開始時間と話者, 単語...)。行が終わるまで単語を溜め、最後に１回だけ連結する
+    row = None
+    speaker = -1
+    for start, best_path, link_speaker, word in links:
+        if word in CSV_IGNORE_WORDS or best_path is not True:
+            continue
+        word = str(word.replace("＋", "+"))
+        # word = word.replace("-", "―")
+        if row is not None and link_speaker == speaker:
+            row.append(word)
+        else:
+            if row is not None:
+                yield "".join(row) + "\""
+            row = [str(start) + ",話者:" + str(link_speaker) + ",\"", word]
+        speaker = link_speaker
+    if row is not None:
+        yield "".join(row) + "\""
+
+
+def csv_lines(lattice):
+    """lattice2csv()の文字列を先頭から順に返すジェネレータ(各行の前に改行を付ける)"""
+    yield CSV_HEADER
+    for row in iter_csv_rows(lattice):
+        yield "\n" + row
+
+
+def lattice2csv(lattice):
+    return "".join(csv_lines(lattice))
+
+
+def file_output(data, output_file):
+    """文字列か、文字列を順に返すイテレータ(csv_lines()など)をファイルに出力する関数"""
+    if isinstance(data, str):
+        data = (data,)
+    with codecs.open(output_file, "w", "utf-8-sig") as o:
+        for text in data:
+            o.write(text)
+
+
+def _output_rows(rows, output_file):
+    """iter_csv_rows()の行をそのまま返しながら、lattice2csv()の形式でファイルにも出力するジェネレータ"""
+    with codecs.open(output_file, "w", "utf-8-sig") as o:
+        o.write(CSV_HEADER)
+        for row in rows:
+            o.write("\n" + row)
+            yield row
+
+
+def number_rows(rows, tag):
+    """iter_csv_rows()の行から内容に数字を含む行を取り出し、
+    result.csvの行([開始時間, 話者, タグ, 内容])のリストにして返す関数
+    """
+    result = []
+    for line in rows:
+        data = line.split(",")
+        if NUMBER_PATTERN.search(data[2]):
+            result.append([float(data[0]), data[1], tag, data[-1] + "\n"])
+    return result
+
+
+def convert_lattice(trans, lattice, output_path=None, variants=VARIANTS):
+    """Latticeをvariants(VARIANTSの形式)の種類ごとに変換し、result.csvに出力する行を開始時間順に並べて返す関数。
+    latticeは辞書形式かLatticeColumns。辞書形式の場合はLatticeColumnsにして時間順に１回だけ並べ、
+    種類ごとにexecute_columns()で単語の列だけを変換する(結果はexecute()と同じ)。
+    output_pathを指定した場合は、種類ごとの変換結果を「output_path + ファイル名の末尾 + .csv」に出力する。
+    """
+    if not isinstance(lattice, lattice_columns.LatticeColumns):
+        lattice = lattice_columns.LatticeColumns.from_lattice(lattice)
+    rows = []
+    for suffix, tag, force_trans in variants:
+        if force_trans is None:
+            converted = lattice
+        else:
+            converted = trans.execute_columns(lattice, [], force_trans=force_trans)
+        csv_rows = iter_csv_rows(converted)
+        if output_path is not None:
+            csv_rows = _output_rows(csv_rows, output_path + suffix + ".csv")
+        rows.extend(number_rows(csv_rows, tag))
+    rows.sort()
+    return rows
+
+
+def result_text(input_file, rows):
+    """result.csvに出力する１ファイル分の文字列を返す関数。直前の行と同じ開始時間は空欄にする"""
+    if not rows:
+        return "\n"
+    lines = [input_file + "\n"]
+    before_start = ""
+    for start, speaker, tag, content in rows:
+        start = str(start)
+        if before_start != start:
+            before_start = start
+        else:
+            start = ""
+        lines.append(", ".join([start, speaker, tag, content]))
+    lines.append("\n")
+    return "".join(lines)
+
+
+class ResultWriter(object):
+    """result.csvを出力するクラス。ファイルごとの結果を入力ファイル名順に並べて出力する。
+    結果はmax_buffer行までメモリに持ち、超えた場合は入力ファイル名順に並べて一時ファイルに書き出す。
+    close()でメモリの分と全ての一時ファイルをマージし、開いたままのresult.csvに書き込む。
+    """
+    def __init__(self, path, max_buffer=RESULT_MAX_BUFFER):
+        self.path = path
+        self.max_buffer = max_buffer
+        # (入力ファイル名, result_text()の文字列)のリスト
+        self.buffer = []
+        self.buffer_rows = 0
+        # 書き出した一時ファイル
+        self.runs = []
+        self.output = open(path, mode="w", encoding="utf-8-sig", buffering=RESULT_BUFFER_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, input_file, rows):
+        """１ファイル分の結果(convert_lattice()の結果)を追加するメソッド"""
+        self.buffer.append((input_file, result_text(input_file, rows)))
+        self.buffer_rows += len(rows) + 1
+        if self.buffer_rows >= self.max_buffer:
+            self._spill()
+
+    def _spill(self):
+        """メモリの結果を入力ファイル名順に並べて一時ファイルに書き出すメソッド"""
+        self.buffer.sort(key=operator.itemgetter(0))
+        run = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+        for record in self.buffer:
+            run.write(json.dumps(record, ensure_ascii=False) + "\n")
+        run.seek(0)
+        self.runs.append(run)
+        self.buffer = []
+        self.buffer_rows = 0
+
+    @staticmethod
+    def _read_run(run):
+        for line in run:
+            yield json.loads(line)
+
+    def close(self):
+        """全ての結果を入力ファイル名順にマージしてresult.csvに書き込み、ファイルを閉じるメソッド"""
+        if self.output.closed:
+            return
+        self.buffer.sort(key=operator.itemgetter(0))
+        # heapq.merge()は同じファイル名の場合は先に書き出した方を先に返すため、結果は常に同じ順になる
+        merged = heapq.merge(*[self._read_run(run) for run in self.runs], self.buffer,
+                             key=operator.itemgetter(0))
+        try:
+            for input_file, text in merged:
+                self.output.write(text)
+        finally:
+            self.output.close()
+            for run in self.runs:
+                run.close()
+            self.runs = []
+            self.buffer = []
+
+
+def file_hash(path):
+    """ファイルの内容のハッシュ値を返す関数"""
+    digest = hashlib.sha256()
+    with open(path, mode="rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    """変換済みのファイルを出力フォルダに記録するクラス。
+    入力ファイルの相対パスごとに、変換条件(内容のハッシュ値、変換設定の版、変換の種類など)と
+    result.csvに出力する行を１行のJSONとして追記する。同じ条件のファイルは記録した行を使い回し、変換しない。
+    １ファイル変換するごとに書き込むため、途中で終了した場合も変換済みのファイルから再開できる。
+    """
+    def __init__(self, path):
+        self.path = path
+        # {入力ファイルの相対パス: {"path": 相対パス, "key": 変換条件, "rows": 行}}
+        self.entries = {}
+        if os.path.exists(path):
+            self._load()
+        self.output = open(path, mode="a", encoding="utf-8")
+
+    def _load(self):
+        with open(self.path, mode="r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 書き込みの途中で終了した行は無視する
+                    continue
+                self.entries[entry["path"]] = entry
+
+    def lookup(self, input_file, key):
+        """変換条件が同じ場合は記録した行を、それ以外の場合はNoneを返すメソッド"""
+        entry = self.entries.get(input_file)
+        if entry is None or entry["key"] != key:
+            return None
+        return entry["rows"]
+
+    def record(self, input_file, key, rows):
+        """変換したファイルを記録するメソッド"""
+        entry = {"path": input_file, "key": key, "rows": rows}
+        self.entries[input_file] = entry
+        self.output.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.output.flush()
+
+    def close(self, input_files=None):
+        """ファイルを閉じるメソッド。input_filesを渡した場合は、そのファイルの最新の記録だけを残して書き直す"""
+        self.output.close()
+        if input_files is None:
+            return
+        temp_path = self.path + ".tmp"
+        with open(temp_path, mode="w", encoding="utf-8") as f:
+            for input_file in input_files:
+                if input_file in self.entries:
+                    f.write(json.dumps(self.entries[input_file], ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+
+
+def find_input_files(input_folder, recursive=False, exclude=None):
+    """input_folderの読み込み対象のファイル(拡張子がINPUT_EXTENSIONS)のinput_folderからの相対パスを
+    名前順に返す関数。recursive=Trueの場合はサブフォルダも探す。excludeのフォルダの中は探さない。
+    """
+    if not recursive:
+        return sorted(name for name in os.listdir(input_folder)
+                      if os.path.splitext(name)[1] in INPUT_EXTENSIONS)
+
+    input_files = []
+    exclude = None if exclude is None else os.path.abspath(exclude)
+    for folder, sub_folders, names in os.walk(input_folder):
+        # 出力先フォルダの中は探さない
+        sub_folders[:] = [name for name in sub_folders
+                          if os.path.abspath(os.path.join(folder, name)) != exclude]
+        for name in names:
+            if os.path.splitext(name)[1] in INPUT_EXTENSIONS:
+                input_files.append(os.path.relpath(os.path.join(folder, name), input_folder))
+    return sorted(input_files)
+
+
+def convert_file(trans, input_folder, input_file, output_folder, write_csv=True, variants=VARIANTS,
+                 cache_dir=None):
+    """input_folderのinput_file(相対パス)を読み込んで変換し、result.csvに出力する行を返す関数。
+    cache_dirを指定した場合は、読み込んだLatticeをバイナリ形式のキャッシュにして次回から使い回す。
+    """
+    if cache_dir is None:
+        # best_pathのリンクだけを少しずつ読み込み、Latticeごとに列にする
+        lattice, keywords = lattice_io.load_lattice_columns(os.path.join(input_folder, input_file))
+    else:
+        lattice, keywords = lattice_io.load_lattice_cached(os.path.join(input_folder, input_file), cache_dir)
+
+    output_path = None
+    if write_csv:
+        output_path = os.path.join(output_folder, os.path.splitext(input_file)[0])
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    return convert_lattice(trans, lattice, output_path, variants)
+
+
+def process_folder(trans, input_folder, output_folder, write_csv=True, recursive=False, variants=VARIANTS,
+                   workers=1, resume=False, cache_dir=None):
+    """input_folderのjsonファイルを変換し、output_folderにresult.csvを出力する関数。
+    output_folderが相対パスの場合はinput_folderからの相対パスとする。
+    write_csv=Trueの場合は、ファイルごとの変換結果のCSVもoutput_folderに出力する。
+    recursive=Trueの場合はサブフォルダのファイルも変換する。variantsは変換の種類(VARIANTSの形式)。
+    workersが2以上の場合は、ファイルごとにworkers個のプロセスで並列に変換する。
+    resume=Trueの場合は、output_folderのManifestに同じ条件で記録されたファイルは変換せず、記録した結果を使う。
+    cache_dirを指定した場合は、読み込んだLatticeのキャッシュ(lattice_io.load_lattice_cached())を使う。
+    (result.csvのパス, 変換できなかったファイルのリスト)を返す。
+    """
+    output_folder = os.path.join(input_folder, output_folder)
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    result_path = os.path.join(output_folder, "result.csv")
+
+    input_files = find_input_files(input_folder, recursive=recursive, exclude=output_folder)
+    failed_files = []
+    manifest = Manifest(os.path.join(output_folder, MANIFEST_NAME)) if resume else None
+    try:
+        with ResultWriter(result_path) as writer:
+            # 変換条件のうち、ファイルによらないもの
+            base_key = {
+                "engine": type(trans).__module__,
+                "config": arabic_original.config_version(trans.setting),
+                "variants": [list(variant) for variant in variants],
+                "csv": write_csv,
+            }
+            keys = {}
+            convert_files = []
+            for input_file in input_files:
+                if manifest is not None:
+                    keys[input_file] = _manifest_key(base_key, input_folder, input_file)
+                    rows = manifest.lookup(input_file, keys[input_file])
+                    # 前回出力したCSVが消されている場合は変換し直す
+                    if rows is not None and (not write_csv or _csv_exists(output_folder, input_file, variants)):
+                        writer.add(input_file, rows)
+                        continue
+                convert_files.append(input_file)
+
+            for input_file, rows in _convert_files(trans, input_folder, convert_files, output_folder,
+                                                   write_csv, variants, workers, cache_dir):
+                if isinstance(rows, Exception):
+                    print(input_file + "でエラー(" + str(rows) + ")")
+                    failed_files.append(input_file)
+                    continue
+                writer.add(input_file, rows)
+                if manifest is not None and keys[input_file] is not None:
+                    manifest.record(input_file, keys[input_file], rows)
+    finally:
+        if manifest is not None:
+            manifest.close(input_files)
+
+    return result_path, failed_files
+
+
+def process_ndjson(trans, input_file, output_file, output_format="lattice", force_trans=False, workers=1,
+                   flush_lines=NDJSON_FLUSH_LINES):
+    """NDJSON(１行に１つのLattice。形式はlattice_io.parse_ndjson_line())を１行ずつ読み込んで変換し、書き込む関数。
+    input_file、output_fileは開いたテキストファイル。output_formatが"lattice"の場合は変換後のLatticeを
+    入力と同じ形式で１行ずつ、"csv"の場合はlattice2csv()の行(見出しは先頭に１回だけ)を書き込む。
+    書き込みはflush_lines行ごとにまとめて行う。workersが2以上の場合はKansuji2Arabic.execute_many()で並列に変換する。
+    読み込み・変換できなかった行は飛ばして標準エラー出力に表示する。(変換した行数, 変換できなかった行数)を返す。
+    """
+    # 変換待ちの行の(行番号, 付加情報)。execute_many()は入力順に結果を返すため、先頭から順に対応する
+    pending = collections.deque()
+    failed = [0]
+
+    def read_lattices():
+        for number, line in enumerate(input_file, 1):
+            if not line.strip():
+                continue
+            try:
+                lattice, extra = lattice_io.parse_ndjson_line(line)
+            except (ValueError, KeyError, TypeError, AttributeError) as err:
+                print(str(number) + "行目を読み込めません(" + str(err) + ")", file=sys.stderr)
+                failed[0] += 1
+                continue
+            pending.append((number, extra))
+            yield lattice
+
+    buffer = []
+    if output_format == "csv":
+        buffer.append(CSV_HEADER + "\n")
+    converted = 0
+    for result in trans.execute_many(read_lattices(), force_trans=force_trans, workers=workers,
+                                     return_exceptions=True):
+        number, extra = pending.popleft()
+        if isinstance(result, Exception):
+            print(str(number) + "行目を変換できません(" + str(result) + ")", file=sys.stderr)
+            failed[0] += 1
+            continue
+        try:
+            if output_format == "csv":
+                lines = [row + "\n" for row in iter_csv_rows(result)]
+            elif extra:
+                lines = [json.dumps(dict(extra, lattice=result), ensure_ascii=False) + "\n"]
+            else:
+                lines = [json.dumps(result, ensure_ascii=False) + "\n"]
+        except Exception as err:
+            print(str(number) + "行目を出力できません(" + str(err) + ")", file=sys.stderr)
+            failed[0] += 1
+            continue
+        converted += 1
+        buffer.extend(lines)
+        if len(buffer) >= flush_lines:
+            output_file.writelines(buffer)
+            output_file.flush()
+            buffer = []
+    output_file.writelines(buffer)
+    output_file.flush()
+    return converted, failed[0]
+
+
+def _manifest_key(base_key, input_folder, input_file):
+    """Manifestに記録する変換条件(base_keyにファイルの内容のハッシュ値を加えたもの)を返す関数。
+    ファイルが読めない場合はNone
+    """
+    try:
+        content_hash = file_hash(os.path.join(input_folder, input_file))
+    except OSError:
+        return None
+    return dict(base_key, hash=content_hash)
+
+
+def _csv_exists(output_folder, input_file, variants):
+    """ファイルごとの変換結果のCSVが全て出力済みかどうかを返す関数"""
+    output_path = os.path.join(output_folder, os.path.splitext(input_file)[0])
+    return all(os.path.exists(output_path + suffix + ".csv") for suffix, tag, force_trans in variants)
+
+
+def _convert_files(trans, input_folder, input_files, output_folder, write_csv, variants, workers, cache_dir):
+    """convert_file()を順に、またはワーカープロセスで行い、(ファイル, 結果か例外)を入力順に返すジェネレータ"""
+    if workers <= 1:
+        for input_file in input_files:
+            try:
+                rows = convert_file(trans, input_folder, input_file, output_folder, write_csv, variants,
+                                    cache_dir)
+            except Exception as err:
+                rows = err
+            yield input_file, rows
+        return
+
+    convert = functools.partial(_convert_worker, input_folder=input_folder, output_folder=output_folder,
+                                write_csv=write_csv, variants=variants, cache_dir=cache_dir)
+    with arabic_original.WorkerPool(trans, workers) as pool:
+        # 結果は入力順に返るため、ファイルと順に対応させる
+        yield from zip(input_files, pool.map(convert, input_files, return_exceptions=True))
+
+
+def _convert_worker(trans, input_file, input_folder, output_folder, write_csv, variants, cache_dir):
+    """ワーカープロセスで１ファイル変換する関数"""
+    return convert_file(trans, input_folder, input_file, output_folder, write_csv, variants, cache_dir)
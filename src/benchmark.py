@@ -0,0 +1,264 @@
+# coding: utf-8
+"""アラビア変換の性能を測定するコマンド。
+
+乱数の種を固定したLattice(リンク数・話者数・数字の割合ごと)を作り、変換クラスごとに
+ウォームアップの後で繰り返し変換して、１秒あたりに変換したリンク数を測定する。
+結果はJSONファイルに出力し、前回の結果(--baseline)と比べて閾値以上遅くなった場合は終了コード1で終了する。
+    python -m src.benchmark [--sizes 1000,10000,100000,1000000] [--speakers 1,10] [--densities 0.1,0.5,0.9]
+                            [--engines arabic,arabic_original] [--warmups 1] [--repeats 3] [-o benchmark.json]
+                            [--baseline 前回のbenchmark.json] [--threshold 0.1]
+変換設定(arabia_configs.json)は実行時のフォルダから読み込む。
+"""
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+
+from src import arabic
+from src import arabic_original
+
+
+# 結果のJSONの形式の版
+RESULT_FORMAT = 1
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_SPEAKERS = (1, 10)
+DEFAULT_DENSITIES = (0.1, 0.5, 0.9)
+DEFAULT_WARMUPS = 1
+DEFAULT_REPEATS = 3
+# 前回よりこの割合以上遅くなった場合は性能低下とする
+DEFAULT_THRESHOLD = 0.1
+
+# 数字の単語に使う文字
+NUMBER_CHARS = "０１２３４５６７８９0123456789一二三四五六七八九〇零十百千万億兆点、"
+# 数字以外の単語に使う文字
+OTHER_CHARS = "abcdefghijklmnあいうえおかきくけこさしすせそたちつてと月分日時秒回円"
+# 発話の区切りなどの単語
+SPECIAL_WORDS = ("!NULL", "!ENTER", "!EXIT", "")
+# 区切りなどの単語の割合
+SPECIAL_RATE = 0.05
+
+
+def generate_lattice(links, speakers=1, density=0.5, seed=0):
+    """測定用のLatticeを作る関数。linksはリンク数の合計、densityは数字の単語の割合。
+    同じ引数では常に同じLatticeになる
+    """
+    rand = random.Random("{}-{}-{}-{}".format(seed, links, speakers, density))
+    lattice = {}
+    for speaker in range(1, speakers + 1):
+        # リンク数を話者に均等に分ける(余りは先頭の話者から１つずつ)
+        count = links // speakers + (1 if speaker <= links % speakers else 0)
+        lattices = {}
+        for word_index in range(count):
+            value = rand.random()
+            if value < SPECIAL_RATE:
+                word = rand.choice(SPECIAL_WORDS)
+            elif value < SPECIAL_RATE + density * (1 - SPECIAL_RATE):
+                word = "".join(rand.choice(NUMBER_CHARS) for i in range(rand.choice((1, 1, 2, 3, 4))))
+            else:
+                word = "".join(rand.choice(OTHER_CHARS) for i in range(rand.choice((1, 2, 3, 4))))
+            lattices[str(word_index)] = {
+                "start": word_index / 10,
+                "end": (word_index + 1) / 10,
+                "weight": 0,
+                "best_path": True,
+                "speaker": speaker,
+                "word": word,
+                "intensity": 0
+            }
+        lattice[str(speaker)] = lattices
+    return lattice
+
+
+def _run_arabic(trans, lattice, force_trans):
+    return trans.execute(lattice, force_trans=force_trans)
+
+
+def _run_arabic_original(trans, lattice, force_trans):
+    return trans.execute(lattice, [], force_trans=force_trans)
+
+
+def _run_arabic_original_fused(trans, lattice, force_trans):
+    return trans.execute(lattice, [], force_trans=force_trans, fused=True)
+
+
+# 測定する変換クラス。{名前: (変換クラス, 変換する関数)}
+ENGINES = {
+    "arabic": (arabic.Kansuji2Arabic, _run_arabic),
+    "arabic_original": (arabic_original.Kansuji2Arabic, _run_arabic_original),
+    "arabic_original_fused": (arabic_original.Kansuji2Arabic, _run_arabic_original_fused),
+}
+
+
+def measure(func, warmups=DEFAULT_WARMUPS, repeats=DEFAULT_REPEATS):
+    """funcをwarmups回実行した後、repeats回実行して各回の時間(秒)のリストを返す関数。
+    測定中はtimeitと同様にガベージコレクションを止める
+    """
+    for i in range(warmups):
+        func()
+    times = []
+    for i in range(repeats):
+        gc.collect()
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        finally:
+            if enabled:
+                gc.enable()
+    return times
+
+
+def scenario_key(result):
+    """前回の結果と比べる時に使う、測定条件のキーを返す関数"""
+    return result["engine"], result["links"], result["speakers"], result["density"], result["force_trans"]
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, speakers_list=DEFAULT_SPEAKERS, densities=DEFAULT_DENSITIES,
+                  engines=tuple(ENGINES), warmups=DEFAULT_WARMUPS, repeats=DEFAULT_REPEATS, seed=0,
+                  force_trans=True, progress=None):
+    """全ての測定条件を測定し、結果のリストを返す関数。
+    progressを指定した場合は、測定条件ごとに結果を渡して呼ぶ
+    """
+    instances = {name: ENGINES[name][0]() for name in engines}
+    results = []
+    for links in sizes:
+        for speakers in speakers_list:
+            for density in densities:
+                lattice = generate_lattice(links, speakers, density, seed)
+                for name in engines:
+                    trans = instances[name]
+                    run = ENGINES[name][1]
+                    times = measure(lambda: run(trans, lattice, force_trans), warmups, repeats)
+                    median = statistics.median(times)
+                    result = {
+                        "engine": name,
+                        "links": links,
+                        "speakers": speakers,
+                        "density": density,
+                        "force_trans": force_trans,
+                        "seed": seed,
+                        "warmups": warmups,
+                        "times": times,
+                        "min": min(times),
+                        "median": median,
+                        "links_per_sec": links / median if median > 0 else 0.0
+                    }
+                    results.append(result)
+                    if progress is not None:
+                        progress(result)
+                del lattice
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """前回の結果と比べ、１秒あたりのリンク数がthresholdの割合以上減った測定条件の
+    (今回の結果, 前回の結果)のリストを返す関数。前回に無い測定条件は比べない
+    """
+    previous = {scenario_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(scenario_key(result))
+        if old is None or old["links_per_sec"] <= 0:
+            continue
+        if result["links_per_sec"] < old["links_per_sec"] * (1 - threshold):
+            regressions.append((result, old))
+    return regressions
+
+
+def environment():
+    """測定環境の情報を返す関数"""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "config_version": arabic_original.Kansuji2Arabic().config.version
+    }
+
+
+def parse_list(value_type):
+    """カンマ区切りの値をvalue_typeのタプルにする関数を返す関数(argparseのtypeに使う)"""
+    def parse(text):
+        try:
+            values = tuple(value_type(value.strip()) for value in text.split(",") if value.strip())
+        except ValueError:
+            raise argparse.ArgumentTypeError("値が不正です: " + text)
+        if not values:
+            raise argparse.ArgumentTypeError("値を指定してください")
+        return values
+    return parse
+
+
+def parse_engines(text):
+    names = parse_list(str)(text)
+    for name in names:
+        if name not in ENGINES:
+            raise argparse.ArgumentTypeError("不明な変換クラスです: " + name + " (" + ", ".join(ENGINES) + "のいずれか)")
+    return names
+
+
+def format_result(result):
+    return (result["engine"] + " links=" + str(result["links"]) + " speakers=" + str(result["speakers"])
+            + " density=" + str(result["density"]) + ": " + format(result["median"], ".4f") + "秒 "
+            + format(result["links_per_sec"], ",.0f") + " links/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.benchmark", description="アラビア変換の性能を測定する")
+    parser.add_argument("--sizes", type=parse_list(int), default=DEFAULT_SIZES, help="リンク数(カンマ区切り)")
+    parser.add_argument("--speakers", type=parse_list(int), default=DEFAULT_SPEAKERS, help="話者数(カンマ区切り)")
+    parser.add_argument("--densities", type=parse_list(float), default=DEFAULT_DENSITIES,
+                        help="数字の単語の割合(カンマ区切り)")
+    parser.add_argument("--engines", type=parse_engines, default=tuple(ENGINES),
+                        help="測定する変換クラス(" + ", ".join(ENGINES) + "。既定値は全て)")
+    parser.add_argument("--warmups", type=int, default=DEFAULT_WARMUPS, help="測定前に実行する回数")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="測定する回数(中央値を使う)")
+    parser.add_argument("--seed", type=int, default=0, help="Latticeを作る乱数の種")
+    parser.add_argument("--no-force-trans", action="store_true", help="強制アラビア変換を行わずに測定する")
+    parser.add_argument("-o", "--output", help="結果を出力するJSONファイル")
+    parser.add_argument("--baseline", help="比べる前回の結果のJSONファイル")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="前回よりこの割合以上遅くなった場合に失敗とする(既定値は0.1)")
+    args = parser.parse_args(argv)
+    if args.repeats < 1:
+        parser.error("--repeatsは1以上を指定してください")
+
+    def progress(result):
+        print(format_result(result), file=sys.stderr)
+
+    report = {
+        "format": RESULT_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "results": run_benchmark(args.sizes, args.speakers, args.densities, args.engines, args.warmups,
+                                 args.repeats, args.seed, force_trans=not args.no_force_trans,
+                                 progress=progress)
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, mode="w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline, args.threshold)
+        for result, old in regressions:
+            print("性能低下: " + format_result(result) + " (前回 " + format(old["links_per_sec"], ",.0f")
+                  + " links/s)", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# coding: utf-8
+"""アラビア変換の各変換方法の結果がexecute()と同じかを確かめるコマンド。
+
+乱数の種を固定したLatticeを作り、execute()の結果と次の変換方法の結果を比べる。
+    fused: execute(fused=True)
+    copy_on_write: execute(copy_on_write=True)(引数のLatticeが変わらないことも確かめる)
+    parallel: execute_parallel()とexecute_many()(ワーカープロセス)
+    columns: execute_columns()の結果をLatticeColumns.to_dict()で戻したもの
+    streaming: StreamingKansuji2Arabicに話者ごとに時間順にpush()し、最後にflush()したもの
+「万」「が」「一」のように複数のリンクにまたがる除外単語を含むLatticeと、
+小数点や桁区切りの後の万億兆(「2.5万」など)や万億兆の並び(「一兆二億三万四」「〇万」など)のparse_kansuji()の結果も確かめる。
+異なる結果があった場合は終了コード1で終了する。
+    python -m src.check_equivalence [--seeds 20] [--links 500] [--workers 2]
+変換設定(arabia_configs.json)は実行時のフォルダから読み込む。
+"""
+import sys
+import copy
+import random
+import argparse
+
+from src import benchmark
+from src import arabic_original
+from src import lattice_columns
+
+
+DEFAULT_SEEDS = 20
+DEFAULT_LINKS = 500
+DEFAULT_WORKERS = 2
+
+# parse_kansuji()の(単語, sep, 期待する結果)
+PARSE_CASES = (
+    ("2.5万", False, "2.5万"),
+    ("2.5万", True, "2.5万"),
+    ("二点五万", False, "2点5万"),
+    ("二点五万", True, "2点5万"),
+    ("1,000万", False, "1,000万"),
+    ("1,000万", True, "1,000万"),
+    ("1.5億円", False, "1.5億円"),
+    ("二万五千", False, "25000"),
+    ("二万五千", True, "25,000"),
+    ("一兆二億三万四", False, "1000200030004"),
+    ("十二万三千四百五十六億", False, "十二万三千四百五十六億"),
+    ("〇万", False, "〇万"),
+    ("0万", True, "0万"),
+)
+
+# 複数のリンクにまたがる除外単語を確かめるLatticeの単語
+PHRASE_WORDS = ("万", "が", "一", "あ", "二", "三", "月")
+# 乱数で並べる単語(除外単語の一部になる単語を多めにする)
+PHRASE_VOCABULARY = ("万", "が", "一", "あ", "二", "三", "月", "点", "、", "十", "円", "回",
+                     "が一", "万が", "5", "!NULL", "")
+# 比べるaddwords(「あ二」「が一あ」は複数のリンクにまたがる)
+ADDWORDS_LIST = ([], ["三"], ["あ二"], ["が一あ"])
+
+
+def phrase_lattice(words, speaker="1"):
+    """単語のリストを時間順に並べた１話者分のLatticeを作る関数"""
+    return {speaker: {str(index): {
+        "start": index / 10,
+        "end": (index + 1) / 10,
+        "weight": 0,
+        "best_path": True,
+        "speaker": speaker,
+        "word": word,
+        "intensity": 0
+    } for index, word in enumerate(words)}}
+
+
+def phrase_lattices(seed, count=200):
+    """除外単語を確かめるLatticeを返すジェネレータ。同じseedでは常に同じLatticeになる"""
+    yield phrase_lattice(PHRASE_WORDS)
+    rand = random.Random("phrase-{}".format(seed))
+    for i in range(count):
+        yield phrase_lattice([rand.choice(PHRASE_VOCABULARY) for j in range(rand.randint(1, 12))])
+
+
+def stream(trans, lattice, addwords, force_trans):
+    """StreamingKansuji2Arabicで話者ごとに時間順にpush()して変換し、execute()と同じ形式のLatticeを返す関数"""
+    links = max(len(lattices) for lattices in lattice.values()) + 1 if lattice else 1
+    # 区切りの単語が来ないまま確定しないように、max_pendingはリンク数より大きくする
+    streaming = arabic_original.StreamingKansuji2Arabic(trans, addwords, force_trans, max_pending=links)
+    result = {}
+    for speaker, lattices in lattice.items():
+        converted = {}
+        # execute()と同じく開始時間順(同じ開始時間の場合は元の順)にする
+        for link_id in sorted(lattices, key=lambda key: float(lattices[key]["start"])):
+            converted.update(streaming.push(speaker, link_id, lattices[link_id]))
+        converted.update(streaming.flush(speaker))
+        result[speaker] = converted
+    return result
+
+
+def check_lattice(trans, lattice, addwords, force_trans, workers):
+    """latticeを各変換方法で変換し、execute()と結果が異なる変換方法の名前のリストを返す関数"""
+    expected = trans.execute(lattice, addwords, force_trans=force_trans)
+    original = copy.deepcopy(lattice)
+    results = {
+        "fused": trans.execute(lattice, addwords, force_trans=force_trans, fused=True),
+        "copy_on_write": trans.execute(lattice, addwords, force_trans=force_trans, copy_on_write=True),
+        "columns": trans.execute_columns(lattice_columns.LatticeColumns.from_lattice(lattice), addwords,
+                                         force_trans=force_trans).to_dict(),
+        "streaming": stream(trans, lattice, addwords, force_trans),
+    }
+    if workers > 1:
+        results["parallel"] = trans.execute_parallel(lattice, addwords, force_trans=force_trans, workers=workers)
+    failed = [name for name, result in results.items() if result != expected]
+    if lattice != original:
+        failed.append("copy_on_write(引数のLatticeが変わった)")
+    return failed
+
+
+def check_parse():
+    """parse_kansuji()の結果が期待と異なる場合の(単語, sep, 結果, 期待する結果)のリストを返す関数"""
+    return [(word, sep, arabic_original.parse_kansuji(word, sep), expected)
+            for word, sep, expected in PARSE_CASES
+            if arabic_original.parse_kansuji(word, sep) != expected]
+
+
+def run_checks(seeds=DEFAULT_SEEDS, links=DEFAULT_LINKS, workers=DEFAULT_WORKERS, progress=None):
+    """全ての確認を行い、異なる結果の説明のリストを返す関数"""
+    trans = arabic_original.Kansuji2Arabic()
+    failures = ["parse_kansuji({!r}, sep={}) = {!r} (期待する結果: {!r})".format(*case) for case in check_parse()]
+
+    items = []
+    for seed in range(seeds):
+        density = (0.1, 0.5, 0.9)[seed % 3]
+        speakers = 1 + seed % 3
+        lattice = benchmark.generate_lattice(links, speakers, density, seed)
+        for force_trans in (False, True):
+            addwords = ADDWORDS_LIST[seed % len(ADDWORDS_LIST)]
+            for name in check_lattice(trans, lattice, addwords, force_trans, workers):
+                failures.append("{}: seed={} links={} speakers={} density={} force_trans={} addwords={}".format(
+                    name, seed, links, speakers, density, force_trans, addwords))
+            items.append((lattice, addwords, force_trans))
+        if progress is not None:
+            progress(seed + 1, seeds)
+
+    for index, lattice in enumerate(phrase_lattices(seeds)):
+        words = [link["word"] for link in lattice["1"].values()]
+        for addwords in ADDWORDS_LIST:
+            for force_trans in (False, True):
+                # ワーカープロセスへの受け渡しが多くならないように、並列の確認は生成したLatticeだけで行う
+                for name in check_lattice(trans, lattice, addwords, force_trans, workers=1):
+                    failures.append("{}: words={} force_trans={} addwords={}".format(
+                        name, words, force_trans, addwords))
+
+    if workers > 1:
+        # execute_many()はaddwordsとforce_transを全件で共通にするため、組み合わせごとにまとめて変換する
+        for addwords in ADDWORDS_LIST:
+            for force_trans in (False, True):
+                lattices = [lattice for lattice, item_addwords, item_force_trans in items
+                            if item_addwords == addwords and item_force_trans == force_trans]
+                if not lattices:
+                    continue
+                results = trans.execute_many(lattices, addwords, force_trans=force_trans, workers=workers)
+                for lattice, result in zip(lattices, results):
+                    if result != trans.execute(lattice, addwords, force_trans=force_trans):
+                        failures.append("execute_many: force_trans={} addwords={}".format(force_trans, addwords))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.check_equivalence",
+                                     description="アラビア変換の各変換方法の結果がexecute()と同じかを確かめる")
+    parser.add_argument("--seeds", type=int, default=DEFAULT_SEEDS, help="作るLatticeの数(乱数の種は0から順に使う)")
+    parser.add_argument("--links", type=int, default=DEFAULT_LINKS, help="作るLatticeのリンク数")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="parallelで使うワーカープロセス数(1以下の場合はparallelを確かめない)")
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print(str(done) + "/" + str(total), file=sys.stderr)
+
+    failures = run_checks(args.seeds, args.links, args.workers, progress)
+    for failure in failures:
+        print("結果が異なります: " + failure, file=sys.stderr)
+    if failures:
+        return 1
+    print("全ての変換方法の結果がexecute()と同じです")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+# coding: utf-8
+"""単語が語彙に存在するかを/checkwordsに問い合わせるクライアント。
+
+    client = CheckWordsClient("http://192.168.13.18:19901")
+    exists = client.check(words)          # {単語: True/False}
+    found = client.existing_words(words)  # 存在する単語のリスト(並べ替え済み)
+
+単語はbatch_size個ずつのバッチにして、最大max_in_flight個のバッチを同時に問い合わせる。
+接続はスレッドごとに保持して使い回し(HTTP/1.1のkeep-alive)、問い合わせた結果はクライアント内に保存して
+同じ単語は２回目から問い合わせない。
+
+動作確認用に、指定した語彙で/checkwordsに応答する代わりのサーバーを起動できる。
+    python -m src.checkwords --serve 語彙ファイル [--port 19901]
+    python -m src.checkwords [--url http://127.0.0.1:19901] [--text ０１２３４５６７８９]
+"""
+import sys
+import json
+import argparse
+import threading
+import http.client
+import urllib.parse
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_URL = "http://192.168.13.18:19901"
+# １回に問い合わせる単語の数
+BATCH_SIZE = 5000
+# 同時に問い合わせるバッチの数
+MAX_IN_FLIGHT = 4
+# １回の問い合わせを待つ時間(秒)
+TIMEOUT = 60
+
+
+class CheckWordsError(Exception):
+    """/checkwordsへの問い合わせに失敗した場合の例外"""
+    pass
+
+
+class CheckWordsClient(object):
+    """/checkwordsのクライアント。複数のスレッドから使ってもよい"""
+
+    def __init__(self, url=DEFAULT_URL, batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT, timeout=TIMEOUT):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ("http", "https"):
+            raise ValueError("http://かhttps://で始まるURLを指定してください: " + url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = parsed.path.rstrip("/") + "/checkwords"
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        # 問い合わせた結果。{単語: True/False}
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+        # スレッドごとの接続
+        self.local = threading.local()
+        self.connections = []
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """スレッドを終了し、全ての接続を閉じるメソッド"""
+        self.executor.shutdown()
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+
+    def _connection(self):
+        """このスレッドの接続を返すメソッド。無い場合は作る"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            if self.scheme == "https":
+                connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.connection = connection
+            self.connections.append(connection)
+        return connection
+
+    def _post(self, words):
+        """１バッチ分を問い合わせ、{単語: True/False}を返すメソッド。
+        保持していた接続が相手に閉じられていた場合は、１回だけ接続し直して再送する
+        """
+        body = json.dumps({"words_to_check": words}, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        for retry in (True, False):
+            connection = self._connection()
+            try:
+                connection.request("POST", self.path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as err:
+                connection.close()
+                if retry:
+                    continue
+                raise CheckWordsError("/checkwordsに接続できません: " + str(err))
+            if response.status != 200:
+                raise CheckWordsError("/checkwordsがエラーを返しました: " + str(response.status) + " "
+                                      + data.decode("utf-8", "replace"))
+            try:
+                result = json.loads(data.decode("utf-8"))
+                return {word: result[word]["exists"] is True for word in words}
+            except (ValueError, KeyError, TypeError):
+                raise CheckWordsError("/checkwordsの応答の形式が不正です")
+
+    def check(self, words, progress=None):
+        """単語ごとに語彙に存在するかを調べ、{単語: True/False}を返すメソッド。
+        progressを指定した場合は、バッチを問い合わせ終わるごとに(調べ終わった数, 問い合わせる数)で呼ぶ
+        """
+        words = list(dict.fromkeys(words))
+        with self.cache_lock:
+            missing = [word for word in words if word not in self.cache]
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+
+        done = 0
+        futures = [self.executor.submit(self._post, batch) for batch in batches]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                with self.cache_lock:
+                    self.cache.update(result)
+                done += len(result)
+                if progress is not None:
+                    progress(done, len(missing))
+        finally:
+            for future in futures:
+                future.cancel()
+
+        with self.cache_lock:
+            return {word: self.cache[word] for word in words}
+
+    def existing_words(self, words, progress=None):
+        """語彙に存在する単語を並べ替えたリストで返すメソッド"""
+        return sorted(word for word, exists in self.check(words, progress).items() if exists)
+
+
+def candidate_words(text):
+    """textの文字を１～３個並べた単語(重複無し)を返す関数。
+    x、y、zの組み合わせごとにx、y、z、xy、xz、yz、xyzを作る
+    """
+    words = []
+    for x in text:
+        for y in text:
+            for z in text:
+                words.extend((x, y, z, x + y, x + z, y + z, x + y + z))
+    return list(dict.fromkeys(words))
+
+
+class CheckWordsHandler(BaseHTTPRequestHandler):
+    """代わりのサーバーの/checkwordsを処理するクラス。self.server.vocabularyの単語を存在する単語とする"""
+    # keep-aliveで接続を使い回せるようにする
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        if self.path.rstrip("/").rsplit("/", 1)[-1] != "checkwords":
+            self._send_json(404, {"error": "見つかりません: " + self.path})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            words = json.loads(self.rfile.read(length).decode("utf-8"))["words_to_check"]
+            result = {word: {"exists": word in self.server.vocabulary} for word in words}
+        except (ValueError, KeyError, TypeError) as err:
+            self._send_json(400, {"error": "要求の形式が不正です: " + str(err)})
+            return
+        self._send_json(200, result)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CheckWordsServer(ThreadingHTTPServer):
+    """/checkwordsの代わりのサーバー"""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, vocabulary):
+        super().__init__(address, CheckWordsHandler)
+        self.vocabulary = frozenset(vocabulary)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://" + host + ":" + str(port)
+
+
+def start_server(vocabulary, host="127.0.0.1", port=0):
+    """代わりのサーバーを別スレッドで起動して返す関数。port=0の場合は空いているポートを使う。
+    終了する場合はshutdown()とserver_close()を呼ぶ
+    """
+    server = CheckWordsServer((host, port), vocabulary)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.checkwords",
+                                     description="数字の組み合わせが語彙に存在するかを/checkwordsに問い合わせる")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--text", default="０１２３４５６７８９", help="組み合わせる文字")
+    parser.add_argument("-j", "--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="同時に問い合わせるバッチの数")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="１回に問い合わせる単語の数")
+    parser.add_argument("--serve", metavar="VOCABULARY",
+                        help="１行に１単語の語彙ファイルで/checkwordsに応答する代わりのサーバーを起動する")
+    parser.add_argument("--host", default="127.0.0.1", help="--serveの場合に待ち受けるホスト")
+    parser.add_argument("--port", type=int, default=19901, help="--serveの場合に待ち受けるポート")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        with open(args.serve, encoding="utf-8") as f:
+            vocabulary = [line.strip() for line in f if line.strip()]
+        server = CheckWordsServer((args.host, args.port), vocabulary)
+        print(server.url + "/checkwords で待ち受けます", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+
+    words = candidate_words(args.text)
+    print(len(words))
+
+    def progress(done, total):
+        print(done, "/", total, "個問い合わせ")
+
+    with CheckWordsClient(args.url, batch_size=args.batch_size, max_in_flight=args.max_in_flight) as client:
+        try:
+            print(client.existing_words(words, progress))
+        except CheckWordsError as err:
+            print(err, file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# coding: utf-8
+"""フォルダ内の音声認識結果をまとめてアラビア変換するコマンド(画面無し)。
+
+wxを使わないため、画面の無い環境でも実行できる。
+    python -m src.cli 入力フォルダ 出力フォルダ [-r] [--variants none,arabia1,force_arabia] [-j 4] [--csv] [--cache キャッシュフォルダ] [--force]
+変換設定(arabia_configs.json)は実行時のフォルダから読み込む。
+同じ出力フォルダで再実行した場合、内容と変換条件が前回と同じファイルは変換せずに前回の結果を使う。
+
+--ndjsonを指定した場合は、１行に１つのLatticeがあるNDJSONファイルを１行ずつ変換する(「-」は標準入出力)。
+    python -m src.cli --ndjson lattice 入力ファイル 出力ファイル [--force-trans] [-j 4]
+"""
+import os
+import sys
+import time
+import argparse
+
+from src import arabic_original
+from src import batch
+
+
+def variant_name(variant):
+    """変換の種類の名前(ファイル名の末尾の括弧を除いたもの。変換しない場合はnone)を返す関数"""
+    return variant[0].strip("()") or "none"
+
+
+VARIANT_NAMES = {variant_name(variant): variant for variant in batch.VARIANTS}
+
+
+def parse_variants(text):
+    """カンマ区切りの変換の種類の名前を、batch.VARIANTSの形式のタプルにして返す関数"""
+    names = [name.strip() for name in text.split(",") if name.strip()]
+    for name in names:
+        if name not in VARIANT_NAMES:
+            raise argparse.ArgumentTypeError("不明な変換の種類です: " + name
+                                             + " (" + ", ".join(VARIANT_NAMES) + "のいずれか)")
+    if not names:
+        raise argparse.ArgumentTypeError("変換の種類を指定してください")
+    # 指定された順ではなくbatch.VARIANTSの順で変換する
+    return tuple(variant for variant in batch.VARIANTS if variant_name(variant) in names)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli",
+                                     description="フォルダ内のjsonファイルの漢数字をアラビア数字に変換し、"
+                                                 "出力フォルダにresult.csvを出力する")
+    parser.add_argument("input_folder", metavar="input",
+                        help="jsonファイル(.json/.txt)があるフォルダ(--ndjsonの場合は入力ファイル)")
+    parser.add_argument("output_folder", metavar="output",
+                        help="出力フォルダ。無い場合は作成する(--ndjsonの場合は出力ファイル)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="サブフォルダのファイルも変換する")
+    parser.add_argument("--variants", type=parse_variants, default=batch.VARIANTS,
+                        help="変換の種類をカンマ区切りで指定する(" + ", ".join(VARIANT_NAMES)
+                             + "。既定値は全て)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="並列に変換するプロセス数(既定値は1。0の場合はCPU数)")
+    parser.add_argument("--csv", action="store_true", help="ファイルごとの変換結果のCSVも出力する")
+    parser.add_argument("--cache", metavar="FOLDER",
+                        help="読み込んだLatticeをバイナリ形式のキャッシュにして保存するフォルダ"
+                             "(次回から同じファイルはjsonを読まずにキャッシュを使う)")
+    parser.add_argument("--force", action="store_true",
+                        help="出力フォルダに変換済みの記録があるファイルも全て変換し直す")
+    parser.add_argument("--ndjson", choices=("lattice", "csv"),
+                        help="NDJSONファイルを１行ずつ変換し、変換後のLattice(lattice)かCSVの行(csv)を出力する")
+    parser.add_argument("--force-trans", action="store_true", help="--ndjsonの場合に強制アラビア変換を行う")
+    return parser
+
+
+def open_text(path, mode):
+    """ファイルを開く関数。「-」の場合は標準入力か標準出力を返す"""
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    return open(path, mode=mode, encoding="utf-8")
+
+
+def convert_ndjson(args, workers):
+    """--ndjsonの場合の処理"""
+    trans = arabic_original.Kansuji2Arabic()
+    input_file = open_text(args.input_folder, "r")
+    output_file = open_text(args.output_folder, "w")
+    try:
+        converted, failed = batch.process_ndjson(trans, input_file, output_file, output_format=args.ndjson,
+                                                 force_trans=args.force_trans, workers=workers)
+    finally:
+        for f in (input_file, output_file):
+            if f not in (sys.stdin, sys.stdout):
+                f.close()
+    print(str(converted) + "行を変換しました。", file=sys.stderr)
+    if failed:
+        print("変換できなかった行: " + str(failed) + "行", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    if args.ndjson:
+        return convert_ndjson(args, workers)
+
+    if not os.path.isdir(args.input_folder):
+        print("入力フォルダが見つかりません: " + args.input_folder, file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    trans = arabic_original.Kansuji2Arabic()
+    result_path, failed_files = batch.process_folder(trans, args.input_folder,
+                                                     os.path.abspath(args.output_folder),
+                                                     write_csv=args.csv, recursive=args.recursive,
+                                                     variants=args.variants, workers=workers,
+                                                     resume=not args.force, cache_dir=args.cache)
+    print(result_path + "に出力しました。(" + format(time.perf_counter() - start, ".2f") + "秒)")
+    if failed_files:
+        print("変換できなかったファイル: " + str(len(failed_files)) + "件", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
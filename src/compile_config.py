@@ -0,0 +1,45 @@
+# coding: utf-8
+"""アラビア変換設定(arabia_configs.json)をコンパイルするコマンド。
+
+設定ファイルを読み込み、単位のUnitIndex・除外単語のExclusionIndexを作ってJSONで
+設定ファイルと同じフォルダにarabia_configs.compiledとして保存する。
+変換クラスは設定ファイルが保存後に更新されていなければ、設定ファイルの代わりにこのファイルを読み込む。
+(保存されていない場合は最初に設定ファイルを読み込んだ時に自動的に保存する)
+    python -m src.compile_config [設定ファイル]
+"""
+import os
+import sys
+import time
+import argparse
+
+from src import arabic_original
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.compile_config",
+                                     description="アラビア変換設定をコンパイルして保存する")
+    parser.add_argument("config", nargs="?", default=arabic_original.CONFIG_FILENAME,
+                        help="設定ファイル(既定値は実行時のフォルダのarabia_configs.json)")
+    args = parser.parse_args(argv)
+
+    path = os.path.abspath(args.config)
+    if not os.path.isfile(path):
+        print("設定ファイルが見つかりません: " + path, file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    stamp = arabic_original.config_stamp(path)
+    setting, loaded = arabic_original.parse_arabia_configs(path)
+    if not loaded:
+        print("設定ファイルを読み込めません(詳細はログを確認してください): " + path, file=sys.stderr)
+        return 1
+    compiled = arabic_original.compile_config(setting)
+    output_path = arabic_original.compiled_config_path(path)
+    arabic_original.write_compiled_config(compiled, output_path, stamp)
+    print(output_path + "に出力しました。(版: " + compiled.version + ", 除外単語数: " + str(len(compiled.exclusion))
+          + ", 単位数: " + str(len(compiled.units)) + ", " + format(time.perf_counter() - start, ".3f") + "秒)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# coding: utf-8
+"""アラビア変換の除外単語を照合するモジュール。
+
+除外単語(arabia_configs.jsonの除外単語とaddwords)を１回だけ集合と文字のトライ木にしておき、
+単語ごとの照合を除外単語の数によらない時間で行う。
+音声認識では「万が一」が「万」「が」「一」のように複数のリンクに分かれることがあるため、
+時間順に連続するリンクの単語をつなげたものが除外単語と一致する場合も、それらのリンクを除外する。
+"""
+
+
+# 連続するリンクをつなげる時に読み飛ばす単語
+IGNORE_WORDS = frozenset(["!NULL", "!ENTER", "!EXIT"])
+
+# トライ木の節で、そこで終わる除外単語があることを示すキー(１文字のキーと重ならないように空文字にする)
+TERMINAL = ""
+
+
+class ExclusionIndex(object):
+    """除外単語の集合とトライ木を保持するクラス"""
+    __slots__ = ("words", "trie", "infixes")
+
+    def __init__(self, words=()):
+        # 除外単語の集合(１つのリンクの単語と一致するかの照合に使う)
+        self.words = frozenset(word for word in words if word)
+        # 除外単語の文字のトライ木。{文字: 子の節, ..., TERMINAL: True}
+        self.trie = {}
+        for word in self.words:
+            node = self.trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[TERMINAL] = True
+        # 除外単語の途中(先頭と末尾の文字を含まない部分)の文字列の集合
+        self.infixes = frozenset(word[start:end] for word in self.words
+                                 for start in range(1, len(word) - 1) for end in range(start + 1, len(word)))
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def __len__(self):
+        return len(self.words)
+
+    def to_json(self):
+        """保存用に、JSONにできる辞書にして返すメソッド"""
+        return {"words": sorted(self.words), "trie": self.trie, "infixes": sorted(self.infixes)}
+
+    @classmethod
+    def from_json(cls, data):
+        """to_json()の結果から、トライ木を作り直さずにExclusionIndexを作るメソッド"""
+        index = cls.__new__(cls)
+        index.words = frozenset(data["words"])
+        index.trie = dict(data["trie"])
+        index.infixes = frozenset(data["infixes"])
+        return index
+
+    def inside(self, word):
+        """wordが除外単語の途中(前後に別の文字がある位置)に現れる場合Trueを返すメソッド。
+        この場合、wordのリンクは前後のリンクとつなげて除外単語と一致することがある。
+        """
+        return word in self.infixes
+
+    def covered(self, words):
+        """時間順の単語のリストのうち、除外単語と一致する位置(インデックス)の集合を返すメソッド。
+        １つの単語が除外単語と一致する場合と、連続する複数の単語をつなげたものが除外単語と一致する場合を含む。
+        IGNORE_WORDSの単語は読み飛ばしてつなげる(読み飛ばした単語の位置は含めない)。
+        """
+        covered = set()
+        if not self.words:
+            return covered
+        trie = self.trie
+        positions = [index for index, word in enumerate(words) if word not in IGNORE_WORDS]
+        for start in range(len(positions)):
+            if not words[positions[start]]:
+                continue
+            node = trie
+            for end in range(start, len(positions)):
+                for char in words[positions[end]]:
+                    node = node.get(char)
+                    if node is None:
+                        break
+                else:
+                    if TERMINAL in node:
+                        covered.update(positions[start:end + 1])
+                    continue
+                break
+        return covered
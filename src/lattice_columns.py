@@ -0,0 +1,135 @@
+# coding: utf-8
+"""Latticeを列ごとの配列で保持するモジュール。
+
+tr_edit_lattice()の結果(話者 → ID → リンクの辞書)はリンクごとに７項目の辞書を持つため、
+リンク数が多いとメモリを多く使い、各処理でstartをfloat()で変換しながら並べ替えることになる。
+このモジュールでは話者ごとに開始時間順に並べた配列で保持し、開始時間と終了時間は１回だけ数値に変換する。
+元の辞書形式にはto_dict()で戻す。
+"""
+import array
+
+
+class SpeakerColumns(object):
+    """１話者分のLatticeを列ごとの配列で保持するクラス。
+    リンクは開始時間順(同じ開始時間の場合は元の順)に並べ、位置(インデックス)で参照する。
+    """
+    __slots__ = ("ids", "positions", "starts", "ends", "words", "layout", "values", "raw_times", "irregular")
+
+    # 列として別に持つ項目。それ以外の項目はlayoutの順にvaluesのタプルに入れる
+    COLUMN_KEYS = ("start", "end", "word")
+
+    def __init__(self):
+        # リンクのID
+        self.ids = []
+        # 元の辞書での順番(to_dict()で元の順に戻すために使う)
+        self.positions = array.array("l")
+        # 開始時間と終了時間(数値に変換済み)
+        self.starts = array.array("d")
+        self.ends = array.array("d")
+        # 単語
+        self.words = []
+        # 先頭のリンクの項目名の並び
+        self.layout = ()
+        # start、end、word以外の項目の値(layoutの順)
+        self.values = []
+        # float以外(文字列など)で渡された開始時間と終了時間の元の値。{(位置, 項目名): 値}
+        self.raw_times = {}
+        # 項目名の並びがlayoutと異なるリンクの元の辞書。{位置: 辞書}
+        self.irregular = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_links(cls, links):
+        """IDとリンクの辞書から作るメソッド"""
+        columns = cls()
+        items = list(links.items())
+        starts = [float(link["start"]) for link_id, link in items]
+        # sorted()は安定ソートなので、同じ開始時間のリンクは元の順のまま
+        order = sorted(range(len(items)), key=starts.__getitem__)
+
+        if items:
+            columns.layout = tuple(items[0][1])
+        other_keys = tuple(key for key in columns.layout if key not in cls.COLUMN_KEYS)
+
+        for index, position in enumerate(order):
+            link_id, link = items[position]
+            columns.ids.append(link_id)
+            columns.positions.append(position)
+            columns.starts.append(starts[position])
+            columns.ends.append(float(link["end"]))
+            columns.words.append(link["word"])
+
+            if tuple(link) == columns.layout:
+                columns.values.append(tuple(link[key] for key in other_keys))
+            else:
+                columns.values.append(None)
+                columns.irregular[index] = dict(link)
+
+            for key in ("start", "end"):
+                if type(link[key]) is not float:
+                    columns.raw_times[(index, key)] = link[key]
+        return columns
+
+    def replace_words(self, words):
+        """単語の列だけを置き換えたSpeakerColumnsを返すメソッド。他の列は共有する"""
+        columns = SpeakerColumns()
+        for name in self.__slots__:
+            setattr(columns, name, getattr(self, name))
+        columns.words = words
+        return columns
+
+    def link(self, index):
+        """位置indexのリンクを元の辞書形式で返すメソッド"""
+        word = self.words[index]
+        if index in self.irregular:
+            link = dict(self.irregular[index])
+            link["word"] = word
+            return link
+
+        start = self.raw_times.get((index, "start"), self.starts[index])
+        end = self.raw_times.get((index, "end"), self.ends[index])
+        values = iter(self.values[index])
+        link = {}
+        for key in self.layout:
+            if key == "start":
+                link[key] = start
+            elif key == "end":
+                link[key] = end
+            elif key == "word":
+                link[key] = word
+            else:
+                link[key] = next(values)
+        return link
+
+    def to_dict(self):
+        """元の辞書形式(IDとリンクの辞書)に戻すメソッド。IDは元の辞書と同じ順に並べる"""
+        order = sorted(range(len(self.ids)), key=self.positions.__getitem__)
+        return {self.ids[index]: self.link(index) for index in order}
+
+
+class LatticeColumns(object):
+    """話者ごとのSpeakerColumnsを保持するクラス"""
+    __slots__ = ("speakers",)
+
+    def __init__(self, speakers=None):
+        self.speakers = {} if speakers is None else speakers
+
+    def __len__(self):
+        return sum(len(columns) for columns in self.speakers.values())
+
+    @classmethod
+    def from_lattice(cls, lattice_obj):
+        """tr_edit_lattice()の結果などの辞書形式のLatticeから作るメソッド"""
+        return cls({speaker: SpeakerColumns.from_links(links) for speaker, links in lattice_obj.items()})
+
+    def iter_links(self):
+        """全てのリンクを元の辞書形式で、話者ごとに開始時間順に返すジェネレータ(IDは含まない)"""
+        for columns in self.speakers.values():
+            for index in range(len(columns)):
+                yield columns.link(index)
+
+    def to_dict(self):
+        """元の辞書形式のLatticeに戻すメソッド"""
+        return {speaker: columns.to_dict() for speaker, columns in self.speakers.items()}
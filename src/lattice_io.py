@@ -0,0 +1,515 @@
+# coding: utf-8
+"""音声認識結果(jsonファイル)のLatticeを読み込むモジュール。
+
+json.load()はファイル全体を辞書にしてから処理するため、best_pathではないリンクの方が多い
+認識結果ではメモリと時間の大半が使わないリンクに使われる。
+このモジュールではファイルを少しずつ読み込み、Latticeごとにbest_pathのリンクだけを返す。
+同じファイルを何度も読み込む場合は、読み込んだ結果をバイナリ形式のキャッシュに書き出して使い回せる。
+"""
+import os
+import re
+import sys
+import json
+import mmap
+import array
+import struct
+import hashlib
+
+from src import lattice_columns
+
+
+# １回に読み込む文字数
+CHUNK_SIZE = 1 << 20
+
+# tr_edit_lattice()と同じく、認識結果の中のLatticeの位置
+LATTICE_PATH = ("channels", "firstChannelLabel", "lattice")
+
+# キーワードに含めない単語
+NOT_KEYWORDS = ("!ENTER", "!NULL", "!EXIT")
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# エスケープを含まないキーと「:」(iter_items()で正規表現１回で読むため)
+SIMPLE_KEY = re.compile(r'[ \t\n\r]*"([^"\\]*)"[ \t\n\r]*:[ \t\n\r]*')
+# 値を読み飛ばす時に見る文字(文字列の開始と、オブジェクト・配列の開始と終了)
+SKIP_TOKEN = re.compile(r'["{}\[\]]')
+# 文字列を読み飛ばす時に見る文字(文字列の終了とエスケープ)
+STRING_TOKEN = re.compile(r'["\\]')
+
+DECODER = json.JSONDecoder()
+# 値を１つ読み込むjsonモジュールの関数。(値, 終わりの位置)を返し、読み込めない場合はStopIterationかJSONDecodeError
+SCAN_ONCE = DECODER.scan_once
+
+
+class JsonStreamReader(object):
+    """ファイルを少しずつ読み込みながら、JSONを先頭から順に読むクラス。
+    読み終わった部分はバッファから捨てるため、使うメモリは１回に読み込む量と１つの値の大きさ程度になる。
+    """
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        """次のチャンクをバッファに追加するメソッド。ファイルの終端の場合はFalseを返す"""
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _error(self, message):
+        raise json.JSONDecodeError(message, self.buf, self.pos)
+
+    def peek(self):
+        """空白を読み飛ばし、次の文字を返すメソッド(ファイルの終端の場合は空文字)"""
+        while True:
+            if self.pos < len(self.buf) and self.buf[self.pos] not in " \t\n\r":
+                return self.buf[self.pos]
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read_more():
+                return ""
+
+    def expect(self, char):
+        """次の文字がcharであることを確認して読み進めるメソッド"""
+        if self.peek() != char:
+            self._error("Expecting '" + char + "'")
+        self.pos += 1
+
+    def read_string(self):
+        """次の文字列を読み込んで返すメソッド"""
+        if self.peek() != '"':
+            self._error("Expecting string")
+        while True:
+            try:
+                value, end = json.decoder.scanstring(self.buf, self.pos + 1)
+            except json.JSONDecodeError:
+                # 文字列がチャンクの境目で切れている場合は続きを読み込んでやり直す
+                if self._read_more():
+                    continue
+                raise
+            self.pos = end
+            return value
+
+    def read_value(self):
+        """次の値を読み込んで返すメソッド"""
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._read_more():
+                    continue
+                raise
+            # バッファの末尾で終わった数値は途中で切れている可能性があるため、続きを読み込んでやり直す
+            if end == len(self.buf) and self._read_more():
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        """次の値を、辞書やリストを作らずに読み飛ばすメソッド"""
+        if self.peek() not in ("{", "["):
+            self.read_value()
+            return
+        depth = 0
+        while True:
+            match = SKIP_TOKEN.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self._read_more():
+                    self._error("Unterminated value")
+                continue
+            self.pos = match.end()
+            token = match.group()
+            if token == '"':
+                self._skip_string()
+            elif token in ("{", "["):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _skip_string(self):
+        """文字列の開始の「"」の後から、文字列の終わりまで読み飛ばすメソッド"""
+        while True:
+            match = STRING_TOKEN.search(self.buf, self.pos)
+            if match is None or (match.group() == "\\" and match.end() >= len(self.buf)):
+                # エスケープの途中で切れている場合は「\」から読み直す
+                self.pos = len(self.buf) if match is None else match.start()
+                if not self._read_more():
+                    self._error("Unterminated string")
+                continue
+            if match.group() == '"':
+                self.pos = match.end()
+                return
+            # エスケープされた文字を読み飛ばす
+            self.pos = match.end() + 1
+
+    def iter_object(self):
+        """次のオブジェクトのキーを順に返すジェネレータ。
+        呼び出し側はキーを受け取るごとに、その値をread_value()かskip_value()で読み進めること。
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_string()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            if char == ",":
+                self.pos += 1
+            elif char == "}":
+                self.pos += 1
+                return
+            else:
+                self._error("Expecting ',' delimiter")
+
+    def iter_items(self):
+        """次のオブジェクトの(キー, 値)を順に返すジェネレータ。値は全て読み込む"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            yield self._read_item()
+            char = self.peek()
+            if char == ",":
+                self.pos += 1
+            elif char == "}":
+                self.pos += 1
+                return
+            else:
+                self._error("Expecting ',' delimiter")
+
+    def _read_item(self):
+        """オブジェクトの(キー, 値)を１組読み込むメソッド"""
+        # キーにエスケープが無く、値がバッファ内で終わる場合は正規表現とscan_onceで読む
+        match = SIMPLE_KEY.match(self.buf, self.pos)
+        if match is not None:
+            try:
+                value, end = SCAN_ONCE(self.buf, match.end())
+            except (StopIteration, json.JSONDecodeError):
+                pass
+            else:
+                if end < len(self.buf):
+                    self.pos = end
+                    return match.group(1), value
+        # それ以外(チャンクの境目で切れている場合など)は１つずつ読む
+        key = self.read_string()
+        self.expect(":")
+        return key, self.read_value()
+
+    def descend(self, keys):
+        """オブジェクトのキーを順にたどり、最後のキーの値の直前まで読み進めるメソッド。
+        キーが見つからない場合はKeyError
+        """
+        for key in keys:
+            for name in self.iter_object():
+                if name == key:
+                    break
+                self.skip_value()
+            else:
+                raise KeyError(key)
+
+
+def iter_best_path_links(fp, chunk_size=CHUNK_SIZE):
+    """認識結果のjsonファイルを少しずつ読み込み、Latticeごとに
+    (Latticeの名前, best_pathのIDとリンクの辞書, キーワードのリスト)を返すジェネレータ。
+    リンクの加工はKansuji2Arabic.tr_edit_lattice()と同じ。
+    """
+    reader = JsonStreamReader(fp, chunk_size)
+    reader.descend(LATTICE_PATH)
+    for lattice_name in reader.iter_object():
+        best_path = {}
+        keywords = []
+        has_links = False
+        for key in reader.iter_object():
+            if key != "links":
+                reader.skip_value()
+                continue
+            has_links = True
+            _add_best_path_links(reader.iter_items(), best_path, keywords)
+        if not has_links:
+            raise KeyError("links")
+        yield lattice_name, best_path, keywords
+
+
+def _add_best_path_links(items, best_path, keywords):
+    """(ID, リンク)のうちbest_pathのリンクをbest_pathに、その単語をkeywordsに追加する関数"""
+    for frag_id, frag in items:
+        if frag["best_path"]:
+            if frag["word"] and frag["word"] not in NOT_KEYWORDS:
+                keywords.append(frag["word"])
+            frag["word"] = frag["word"].replace("%", "%%")
+            best_path[frag_id] = frag
+
+
+def load_lattice(path, chunk_size=CHUNK_SIZE):
+    """jsonファイルを少しずつ読み込み、Kansuji2Arabic.tr_edit_lattice()と同じ(best_paths, keywords)を返す関数"""
+    best_paths = {}
+    keywords = []
+    with open(path, mode="r", encoding="utf-8") as f:
+        for lattice_name, best_path, lattice_keywords in iter_best_path_links(f, chunk_size):
+            best_paths[lattice_name] = best_path
+            keywords.extend(lattice_keywords)
+    return best_paths, keywords
+
+
+def load_lattice_columns(path, chunk_size=CHUNK_SIZE):
+    """load_lattice()と同じLatticeをLatticeColumns(src/lattice_columns.py)にして(LatticeColumns, keywords)を返す関数。
+    Latticeごとに読み込んだ時点で列に変換するため、ファイル全体のリンクの辞書は持たない
+    """
+    speakers = {}
+    keywords = []
+    with open(path, mode="r", encoding="utf-8") as f:
+        for lattice_name, best_path, lattice_keywords in iter_best_path_links(f, chunk_size):
+            speakers[lattice_name] = lattice_columns.SpeakerColumns.from_links(best_path)
+            keywords.extend(lattice_keywords)
+    return lattice_columns.LatticeColumns(speakers), keywords
+
+
+def parse_ndjson_line(line):
+    """NDJSON(１行に１つのJSON)の１行を読み込み、(Lattice, 付加情報の辞書)を返す関数。行の形式は次のいずれか。
+        {"lattice": Lattice, ...}: lattice以外の項目(IDなど)は付加情報として返す
+        認識結果(channelsを含むもの): tr_edit_lattice()と同じくbest_pathのリンクだけにする
+        Lattice({話者: {ID: リンク}})
+    """
+    document = json.loads(line)
+    if not isinstance(document, dict):
+        raise ValueError("JSONオブジェクトではありません")
+    if "lattice" in document:
+        extra = dict(document)
+        return extra.pop("lattice"), extra
+    if "channels" in document:
+        lattice_obj = document
+        for key in LATTICE_PATH:
+            lattice_obj = lattice_obj[key]
+        best_paths = {}
+        for lattice_name, lattice_body in lattice_obj.items():
+            best_paths[lattice_name] = {}
+            _add_best_path_links(lattice_body["links"].items(), best_paths[lattice_name], [])
+        return best_paths, {}
+    return document, {}
+
+
+# キャッシュファイルの先頭のバイト列と形式の版
+CACHE_MAGIC = b"LATCACHE"
+CACHE_VERSION = 1
+CACHE_EXTENSION = ".latcache"
+
+# キャッシュのリンクの値の種類と、値を書き込む形式(structの形式)。
+# 文字列とJSON(リストなど)は文字列表の番号を書き込み、True、False、Noneは何も書き込まない
+CACHE_VALUE_FORMATS = {"d": "d", "q": "q", "S": "I", "J": "I", "T": "", "F": "", "N": ""}
+CACHE_CONSTANTS = {"T": True, "F": False, "N": None}
+
+UINT32 = struct.Struct("<I")
+
+
+def _value_type(value):
+    """キャッシュに書き込む値の種類を返す関数"""
+    if value is True:
+        return "T"
+    if value is False:
+        return "F"
+    if value is None:
+        return "N"
+    if type(value) is float:
+        return "d"
+    if type(value) is int and -(1 << 63) <= value < (1 << 63):
+        return "q"
+    if type(value) is str:
+        return "S"
+    return "J"
+
+
+class _StringTable(object):
+    """キャッシュに書き込む文字列を重複無しで番号付けするクラス"""
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def add(self, text):
+        number = self.index.get(text)
+        if number is None:
+            number = self.index[text] = len(self.strings)
+            self.strings.append(text)
+        return number
+
+
+def write_lattice_cache(cache_path, best_paths, keywords, source_stat=None):
+    """load_lattice()の結果(best_paths, keywords)をバイナリ形式のキャッシュファイルに書き出す関数。
+    source_statに元のファイルのos.stat()の結果を渡すと、元のファイルが更新された場合にキャッシュを使わなくなる。
+    リンクは項目名の並びと値の種類の組(シグネチャ)ごとに固定長で書き込み、文字列は文字列表の番号で書き込む。
+    """
+    strings = _StringTable()
+    # {(項目名の並び, 値の種類): (番号, struct.Struct)}
+    signatures = {}
+    body = bytearray()
+
+    body += UINT32.pack(len(keywords))
+    body += array.array("I", [strings.add(keyword) for keyword in keywords]).tobytes()
+    body += UINT32.pack(len(best_paths))
+    for lattice_name, links in best_paths.items():
+        body += struct.pack("<II", strings.add(lattice_name), len(links))
+        for link_id, link in links.items():
+            keys = tuple(link)
+            types = "".join(_value_type(value) for value in link.values())
+            signature = signatures.get((keys, types))
+            if signature is None:
+                link_format = "<I" + "".join(CACHE_VALUE_FORMATS[value_type] for value_type in types)
+                signature = signatures[(keys, types)] = (len(signatures), struct.Struct(link_format))
+            values = [strings.add(link_id)]
+            for value_type, value in zip(types, link.values()):
+                if value_type in ("d", "q"):
+                    values.append(value)
+                elif value_type == "S":
+                    values.append(strings.add(value))
+                elif value_type == "J":
+                    values.append(strings.add(json.dumps(value, ensure_ascii=False)))
+            body += UINT32.pack(signature[0])
+            body += signature[1].pack(*values)
+
+    header = {"version": CACHE_VERSION,
+              "signatures": [[list(keys), types] for (keys, types) in signatures]}
+    if source_stat is not None:
+        header["source"] = [source_stat.st_size, source_stat.st_mtime_ns]
+    header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+
+    encoded = [text.encode("utf-8") for text in strings.strings]
+    offsets = array.array("I", [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    # 書き込み途中のファイルを読まないように、一時ファイルに書き込んでから置き換える。
+    # 同じキャッシュフォルダを複数のプロセスで使っても一時ファイルが重ならないようにプロセスIDを付ける
+    temp_path = cache_path + ".tmp" + str(os.getpid())
+    with open(temp_path, mode="wb") as f:
+        f.write(CACHE_MAGIC)
+        f.write(UINT32.pack(len(header)))
+        f.write(header)
+        f.write(UINT32.pack(len(encoded)))
+        f.write(offsets.tobytes())
+        f.write(b"".join(encoded))
+        f.write(body)
+    os.replace(temp_path, cache_path)
+
+
+def read_lattice_cache(cache_path, source_stat=None):
+    """write_lattice_cache()で書き出したキャッシュファイルを読み込み、(best_paths, keywords)を返す関数。
+    ファイルが無い場合、形式が異なる場合、source_statと書き出した時の元のファイルが異なる場合はNoneを返す。
+    ファイルはメモリマップで読み、同じ文字列は１つの文字列オブジェクトを共有する。
+    """
+    try:
+        f = open(cache_path, mode="rb")
+    except OSError:
+        return None
+    with f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空のファイル
+            return None
+        with buf:
+            try:
+                return _read_cache(buf, source_stat)
+            except (struct.error, ValueError, KeyError, IndexError):
+                return None
+
+
+def _read_cache(buf, source_stat):
+    if buf[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+        return None
+    pos = len(CACHE_MAGIC)
+    header_length, = UINT32.unpack_from(buf, pos)
+    pos += UINT32.size
+    header = json.loads(buf[pos:pos + header_length].decode("utf-8"))
+    pos += header_length
+    if header["version"] != CACHE_VERSION:
+        return None
+    if source_stat is not None and header.get("source") != [source_stat.st_size, source_stat.st_mtime_ns]:
+        return None
+
+    # 文字列表
+    count, = UINT32.unpack_from(buf, pos)
+    pos += UINT32.size
+    offsets = array.array("I")
+    offsets.frombytes(buf[pos:pos + (count + 1) * offsets.itemsize])
+    pos += (count + 1) * offsets.itemsize
+    strings = [buf[pos + offsets[i]:pos + offsets[i + 1]].decode("utf-8") for i in range(count)]
+    pos += offsets[count]
+
+    signatures = []
+    for keys, types in header["signatures"]:
+        keys = [sys.intern(key) for key in keys]
+        link_format = "<I" + "".join(CACHE_VALUE_FORMATS[value_type] for value_type in types)
+        signatures.append((list(zip(keys, types)), struct.Struct(link_format)))
+
+    count, = UINT32.unpack_from(buf, pos)
+    pos += UINT32.size
+    keyword_ids = array.array("I")
+    keyword_ids.frombytes(buf[pos:pos + count * keyword_ids.itemsize])
+    pos += count * keyword_ids.itemsize
+    keywords = [strings[i] for i in keyword_ids]
+
+    best_paths = {}
+    lattice_count, = UINT32.unpack_from(buf, pos)
+    pos += UINT32.size
+    for _ in range(lattice_count):
+        name_id, link_count = struct.unpack_from("<II", buf, pos)
+        pos += 8
+        links = {}
+        for _ in range(link_count):
+            signature_id, = UINT32.unpack_from(buf, pos)
+            pos += UINT32.size
+            fields, link_struct = signatures[signature_id]
+            values = link_struct.unpack_from(buf, pos)
+            pos += link_struct.size
+            link = {}
+            index = 1
+            for key, value_type in fields:
+                if value_type in CACHE_CONSTANTS:
+                    link[key] = CACHE_CONSTANTS[value_type]
+                    continue
+                value = values[index]
+                index += 1
+                if value_type == "S":
+                    value = strings[value]
+                elif value_type == "J":
+                    value = json.loads(strings[value])
+                link[key] = value
+            links[strings[values[0]]] = link
+        best_paths[strings[name_id]] = links
+    return best_paths, keywords
+
+
+def cache_path_for(path, cache_dir):
+    """元のファイルのパスに対応するキャッシュファイルのパスを返す関数"""
+    name = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(cache_dir, name + CACHE_EXTENSION)
+
+
+def load_lattice_cached(path, cache_dir, chunk_size=CHUNK_SIZE):
+    """load_lattice()と同じ結果を返す関数。cache_dirに元のファイルと対応するキャッシュがあればそれを読み込み、
+    無い場合(元のファイルが更新された場合を含む)はload_lattice()で読み込んでキャッシュを書き出す。
+    """
+    source_stat = os.stat(path)
+    cache_path = cache_path_for(path, cache_dir)
+    cached = read_lattice_cache(cache_path, source_stat)
+    if cached is not None:
+        return cached
+
+    best_paths, keywords = load_lattice(path, chunk_size)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_lattice_cache(cache_path, best_paths, keywords, source_stat)
+    return best_paths, keywords
@@ -0,0 +1,235 @@
+# coding: utf-8
+"""アラビア変換をHTTPで行うサービス。
+
+変換設定は起動時に１回だけ読み込み(arabia_configs.jsonが更新された場合は次の要求から新しい設定を使う)、同時に届いた変換要求はまとめて(マイクロバッチ)ワーカーに渡す。
+    python -m src.server [--host 127.0.0.1] [--port 19902] [-j 4] [--max-batch 32] [--max-wait 5]
+
+POST /convert
+    要求: {"lattice": Lattice, "addwords": [除外単語...], "force_trans": false}
+          (lattice以外は省略可。Latticeだけを送ってもよい)
+    応答: 変換後のLattice。要求の形式が不正な場合は400、変換に失敗した場合は500で{"error": メッセージ}
+GET /health
+    応答: {"status": "ok"}
+"""
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import functools
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import arabic_original
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 19902
+
+# １回にワーカーに渡す要求の数の上限
+MAX_BATCH = 32
+# 最初の要求が届いてから、同じバッチにまとめる要求を待つ時間(秒)
+MAX_WAIT = 0.005
+# １つの要求の変換を待つ時間(秒)
+REQUEST_TIMEOUT = 60
+
+
+def convert_items(trans, items):
+    """(Lattice, addwords, force_trans)のリストを変換し、結果か例外のリストを返す関数"""
+    results = []
+    for lattice, addwords, force_trans in items:
+        try:
+            results.append(trans.execute(lattice, addwords, force_trans=force_trans, fused=True))
+        except Exception as err:
+            results.append(err)
+    return results
+
+
+class MicroBatcher(object):
+    """変換要求をまとめてワーカーに渡すクラス。
+    最初の要求が届いてからmax_wait秒の間に届いた要求を、最大max_batch件まで１つのバッチにする。
+    workersが1以上の場合はバッチをワーカー数に分けてワーカープロセスで、0の場合はこのプロセスのスレッドで変換する。
+    """
+    def __init__(self, trans, workers=1, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        if workers > 0:
+            # 設定ファイルを読み込んだ変換クラスの場合は、ワーカーも同じファイルを読み込み、更新されると読み込み直す
+            self.executor = arabic_original.WorkerPool(trans, workers, follow_config=True)
+            self.convert = convert_items
+            # ワーカープロセスは待ち受けのソケットやスレッドを作る前に起動しておく
+            self.executor.start()
+        else:
+            # Kansuji2Arabicは複数のスレッドで共有できる
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self.convert = functools.partial(convert_items, trans)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """(Lattice, addwords, force_trans)の変換を要求し、結果を受け取るFutureを返すメソッド"""
+        future = concurrent.futures.Future()
+        self.queue.put((item, future))
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.executor.shutdown()
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+            self._dispatch(batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch):
+        """バッチをワーカー数に分けてワーカーに渡し、終わったら各要求のFutureに結果を設定するメソッド"""
+        size = -(-len(batch) // max(self.workers, 1))
+        for start in range(0, len(batch), size):
+            self._dispatch_chunk(batch[start:start + size])
+
+    def _dispatch_chunk(self, chunk):
+        """分けたバッチを１つのワーカーに渡すメソッド"""
+        futures = [future for item, future in chunk]
+        try:
+            done = self.executor.submit(self.convert, [item for item, future in chunk])
+        except Exception as err:
+            for future in futures:
+                future.set_exception(err)
+            return
+
+        def set_results(done):
+            try:
+                results = done.result()
+            except Exception as err:
+                results = [err] * len(futures)
+            for future, result in zip(futures, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        done.add_done_callback(set_results)
+
+
+class ConvertHandler(BaseHTTPRequestHandler):
+    """/convertと/healthを処理するクラス。self.server.batcherに変換を要求する"""
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "見つかりません: " + self.path})
+            return
+        self._send_json(200, {"status": "ok"})
+
+    def do_POST(self):
+        if self.path != "/convert":
+            self._send_json(404, {"error": "見つかりません: " + self.path})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            item = self._parse_request(request)
+        except (ValueError, TypeError) as err:
+            self._send_json(400, {"error": "要求の形式が不正です: " + str(err)})
+            return
+
+        try:
+            result = self.server.batcher.submit(item).result(timeout=REQUEST_TIMEOUT)
+        except Exception as err:
+            self._send_json(500, {"error": str(type(err).__name__) + ": " + str(err)})
+            return
+        self._send_json(200, result)
+
+    @staticmethod
+    def _parse_request(request):
+        """要求を(Lattice, addwords, force_trans)にするメソッド"""
+        if not isinstance(request, dict):
+            raise TypeError("JSONオブジェクトではありません")
+        if "lattice" not in request:
+            return request, [], False
+        lattice = request["lattice"]
+        addwords = request.get("addwords", [])
+        if not isinstance(lattice, dict) or not isinstance(addwords, list):
+            raise TypeError("latticeはオブジェクト、addwordsは配列で指定してください")
+        force_trans = request.get("force_trans", False)
+        # 文字列の"false"などを真と扱わないように、JSONの真偽値だけを受け付ける
+        if not isinstance(force_trans, bool):
+            raise TypeError("force_transはtrueかfalseで指定してください")
+        return lattice, addwords, force_trans
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        arabic_original.logger.info("%s - %s", self.address_string(), format % args)
+
+
+class ConvertServer(ThreadingHTTPServer):
+    """要求ごとにスレッドで処理するサーバー。同時に接続が集中しても受け付けられるよう待ち行列を長くする"""
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, trans=None, workers=1, max_batch=MAX_BATCH,
+                  max_wait=MAX_WAIT):
+    """変換サービスのサーバーを作る関数。transを省略した場合は変換設定を読み込んで作る"""
+    if trans is None:
+        trans = arabic_original.Kansuji2Arabic()
+    batcher = MicroBatcher(trans, workers=workers, max_batch=max_batch, max_wait=max_wait)
+    server = ConvertServer((host, port), ConvertHandler)
+    server.batcher = batcher
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.server", description="アラビア変換のHTTPサービス")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="変換するワーカープロセス数(0の場合はこのプロセスで変換する)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="１回にワーカーに渡す要求の数の上限")
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT * 1000,
+                        help="同じバッチにまとめる要求を待つ時間(ミリ秒)")
+    args = parser.parse_args(argv)
+
+    server = create_server(args.host, args.port, workers=args.workers, max_batch=args.max_batch,
+                           max_wait=args.max_wait / 1000)
+    print("http://" + args.host + ":" + str(args.port) + "/convert で待ち受けます", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
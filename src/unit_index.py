@@ -0,0 +1,59 @@
+# coding: utf-8
+"""アラビア変換の単位を照合するモジュール。
+
+単位(arabia_configs.jsonの単位)を文字のトライ木にしておき、単語の先頭が単位かどうかを
+単位の数によらない時間で調べる。単位は文字列(１文字ずつが単位)か、単位のリストで指定する。
+リストの場合は「ヶ月」「キロ」「パーセント」のような複数文字の単位も使える。
+"""
+
+
+# トライ木の節で、そこで終わる単位があることを示すキー(１文字のキーと重ならないように空文字にする)
+TERMINAL = ""
+
+
+class UnitIndex(object):
+    """単位のトライ木を保持するクラス"""
+    __slots__ = ("units", "chars", "trie")
+
+    def __init__(self, units=()):
+        # 単位の集合(空文字は除く)
+        self.units = frozenset(unit for unit in units if unit)
+        # 単位に含まれる文字(正規表現の文字クラスに使う)。並びを固定するため並べ替える
+        self.chars = "".join(sorted(set("".join(self.units))))
+        # 単位の文字のトライ木。{文字: 子の節, ..., TERMINAL: True}
+        self.trie = {}
+        for unit in self.units:
+            node = self.trie
+            for char in unit:
+                node = node.setdefault(char, {})
+            node[TERMINAL] = True
+
+    def __contains__(self, unit):
+        return unit in self.units
+
+    def __len__(self):
+        return len(self.units)
+
+    def to_json(self):
+        """保存用に、JSONにできる辞書にして返すメソッド"""
+        return {"units": sorted(self.units), "chars": self.chars, "trie": self.trie}
+
+    @classmethod
+    def from_json(cls, data):
+        """to_json()の結果から、トライ木を作り直さずにUnitIndexを作るメソッド"""
+        index = cls.__new__(cls)
+        index.units = frozenset(data["units"])
+        index.chars = str(data["chars"])
+        index.trie = dict(data["trie"])
+        return index
+
+    def startswith_unit(self, word):
+        """wordの先頭が単位ならTrueを返すメソッド"""
+        node = self.trie
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                return False
+            if TERMINAL in node:
+                return True
+        return False
@@ -0,0 +1,6 @@
+# coding: utf-8
+import os
+import sys
+
+# テストからも「from src import ...」で読み込めるように、リポジトリのフォルダを先頭に追加する
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
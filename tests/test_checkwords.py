@@ -0,0 +1,126 @@
+# coding: utf-8
+"""CheckWordsClientを代わりのサーバー(start_server())に接続して確かめるテスト"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src import checkwords
+
+
+VOCABULARY = ["０", "１２", "３４５", "６"]
+
+
+@pytest.fixture
+def server():
+    server = checkwords.start_server(VOCABULARY)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_check_batches(server):
+    words = checkwords.candidate_words("０１２")
+    calls = []
+    with checkwords.CheckWordsClient(server.url, batch_size=10, max_in_flight=3) as client:
+        result = client.check(words, progress=lambda done, total: calls.append((done, total)))
+
+    assert result == {word: word in VOCABULARY for word in words}
+    # バッチごとに１回ずつ呼ばれ、最後に全件になる
+    assert len(calls) == -(-len(words) // 10)
+    assert calls[-1] == (len(words), len(words))
+
+
+def test_existing_words(server):
+    with checkwords.CheckWordsClient(server.url, batch_size=7) as client:
+        assert client.existing_words(checkwords.candidate_words("０１２３４５６")) == sorted(VOCABULARY)
+
+
+def test_check_uses_cache(server):
+    words = ["０", "１", "１２"]
+    with checkwords.CheckWordsClient(server.url) as client:
+        first = client.check(words)
+        # サーバーを止めても、問い合わせ済みの単語は保存した結果を返す
+        server.shutdown()
+        server.server_close()
+        calls = []
+        assert client.check(words, progress=lambda done, total: calls.append(done)) == first
+    assert calls == []
+    assert first == {"０": True, "１": False, "１２": True}
+
+
+class ClosingHandler(checkwords.CheckWordsHandler):
+    """応答した後、Connection: closeを送らずに接続を閉じるハンドラー(keep-aliveの接続がサーバーに切られた場合)"""
+
+    def do_POST(self):
+        super().do_POST()
+        self.close_connection = True
+
+
+def test_reconnect_after_connection_closed():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ClosingHandler)
+    server.daemon_threads = True
+    server.vocabulary = frozenset(VOCABULARY)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:" + str(server.server_address[1])
+    try:
+        with checkwords.CheckWordsClient(url, max_in_flight=1) as client:
+            assert client.check(["０"]) == {"０": True}
+            # 同じスレッドの接続を使い回すと切られているため、接続し直して再送する
+            assert client.check(["６", "７"]) == {"６": True, "７": False}
+            assert client.check(["１２"]) == {"１２": True}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class TextHandler(BaseHTTPRequestHandler):
+    """self.server.statusとself.server.bodyをそのまま返すハンドラー"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def text_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TextHandler)
+    server.daemon_threads = True
+    server.status = 200
+    server.body = b"<html>not json</html>"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_non_json_response(text_server):
+    url = "http://127.0.0.1:" + str(text_server.server_address[1])
+    with checkwords.CheckWordsClient(url) as client:
+        with pytest.raises(checkwords.CheckWordsError, match="形式が不正"):
+            client.check(["０"])
+
+
+def test_missing_word_in_response(text_server):
+    text_server.body = b'{"1": {"exists": true}}'
+    url = "http://127.0.0.1:" + str(text_server.server_address[1])
+    with checkwords.CheckWordsClient(url) as client:
+        with pytest.raises(checkwords.CheckWordsError, match="形式が不正"):
+            client.check(["０"])
+
+
+def test_error_status(text_server):
+    text_server.status = 503
+    text_server.body = b"busy"
+    url = "http://127.0.0.1:" + str(text_server.server_address[1])
+    with checkwords.CheckWordsClient(url) as client:
+        with pytest.raises(checkwords.CheckWordsError, match="503 busy"):
+            client.check(["０"])
@@ -0,0 +1,59 @@
+# coding: utf-8
+"""各変換方法の結果がexecute()と同じかを確かめるテスト(src/check_equivalence.pyの確認をpytestで行う)"""
+import os
+
+import pytest
+
+from src import arabic_original
+from src import check_equivalence
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "arabia_configs.json")
+
+
+@pytest.fixture(scope="module")
+def trans():
+    # 実行時のフォルダによらず、リポジトリの設定ファイルで変換する
+    setting, loaded = arabic_original.parse_arabia_configs(CONFIG_PATH)
+    assert loaded
+    return arabic_original.Kansuji2Arabic(setting=setting)
+
+
+@pytest.mark.parametrize("word, sep, expected", check_equivalence.PARSE_CASES)
+def test_parse_kansuji(word, sep, expected):
+    assert arabic_original.parse_kansuji(word, sep) == expected
+
+
+@pytest.mark.parametrize("addwords, expected", [
+    ([], ["万", "が", "一", "あ", "2，", "3", "月"]),
+    (["あ二"], ["万", "が", "一", "あ", "二", "3", "月"]),
+])
+@pytest.mark.parametrize("force_trans", [False, True])
+def test_streaming_multi_link_exclusion(trans, addwords, expected, force_trans):
+    lattice = check_equivalence.phrase_lattice(check_equivalence.PHRASE_WORDS)
+    result = check_equivalence.stream(trans, lattice, addwords, force_trans)
+    assert [result["1"][str(index)]["word"] for index in range(len(expected))] == expected
+    assert result == trans.execute(lattice, addwords, force_trans=force_trans)
+
+
+@pytest.mark.parametrize("addwords", check_equivalence.ADDWORDS_LIST)
+@pytest.mark.parametrize("force_trans", [False, True])
+def test_phrase_lattices(trans, addwords, force_trans):
+    for lattice in check_equivalence.phrase_lattices(0):
+        words = [link["word"] for link in lattice["1"].values()]
+        assert check_equivalence.check_lattice(trans, lattice, addwords, force_trans, workers=1) == [], words
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("force_trans", [False, True])
+def test_generated_lattices(trans, seed, force_trans):
+    lattice = check_equivalence.benchmark.generate_lattice(300, 1 + seed % 3, (0.1, 0.5, 0.9)[seed % 3], seed)
+    addwords = check_equivalence.ADDWORDS_LIST[seed % len(check_equivalence.ADDWORDS_LIST)]
+    assert check_equivalence.check_lattice(trans, lattice, addwords, force_trans, workers=1) == []
+
+
+def test_worker_processes(trans):
+    lattices = [check_equivalence.benchmark.generate_lattice(200, 2, 0.5, seed) for seed in range(4)]
+    expected = [trans.execute(lattice, ["三"], force_trans=True) for lattice in lattices]
+    assert check_equivalence.check_lattice(trans, lattices[0], ["三"], True, workers=2) == []
+    assert list(trans.execute_many(lattices, ["三"], force_trans=True, workers=2)) == expected